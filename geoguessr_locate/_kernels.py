@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+from math import radians, cos, sin, asin, sqrt
+from typing import Sequence
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def _neighbor_counts_py(lats: Sequence[float], lons: Sequence[float], threshold_km: float) -> list[int]:
+    """Count, for each point, how many other points lie within threshold_km.
+
+    Points are swept in latitude order: once the latitude gap alone exceeds the
+    threshold no later point can be a neighbor, so isolated points are pruned
+    without any trig.
+    """
+    n = len(lats)
+    rlat = [radians(x) for x in lats]
+    rlon = [radians(x) for x in lons]
+    coslat = [cos(x) for x in rlat]
+    max_dlat = threshold_km / EARTH_RADIUS_KM
+    order = sorted(range(n), key=rlat.__getitem__)
+    counts = [0] * n
+    for pos, a in enumerate(order):
+        lat_a, lon_a, cos_a = rlat[a], rlon[a], coslat[a]
+        for b in order[pos + 1 :]:
+            if rlat[b] - lat_a > max_dlat:
+                break
+            h = sin((rlat[b] - lat_a) / 2) ** 2 + cos_a * coslat[b] * sin((rlon[b] - lon_a) / 2) ** 2
+            if 2 * EARTH_RADIUS_KM * asin(sqrt(h)) <= threshold_km:
+                counts[a] += 1
+                counts[b] += 1
+    return counts
+
+
+try:  # optional dependency
+    import numpy as np  # type: ignore
+    from numba import njit  # type: ignore
+except ImportError:  # pragma: no cover - numba is not required
+    def neighbor_counts(lats: Sequence[float], lons: Sequence[float], threshold_km: float) -> list[int]:
+        return _neighbor_counts_py(lats, lons, threshold_km)
+
+else:
+    @njit("i8[:](f8[:],f8[:],f8)", cache=True, fastmath=True)
+    def _neighbor_counts_jit(lats, lons, threshold_km):  # pragma: no cover - requires numba
+        n = lats.shape[0]
+        rlat = np.radians(lats)
+        rlon = np.radians(lons)
+        coslat = np.cos(rlat)
+        max_dlat = threshold_km / EARTH_RADIUS_KM
+        order = np.argsort(rlat)
+        counts = np.zeros(n, dtype=np.int64)
+        for pa in range(n):
+            a = order[pa]
+            for pb in range(pa + 1, n):
+                b = order[pb]
+                if rlat[b] - rlat[a] > max_dlat:
+                    break
+                h = np.sin((rlat[b] - rlat[a]) / 2) ** 2 + coslat[a] * coslat[b] * np.sin((rlon[b] - rlon[a]) / 2) ** 2
+                if 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(h)) <= threshold_km:
+                    counts[a] += 1
+                    counts[b] += 1
+        return counts
+
+    def neighbor_counts(lats: Sequence[float], lons: Sequence[float], threshold_km: float) -> list[int]:
+        return _neighbor_counts_jit(
+            np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64), float(threshold_km)
+        ).tolist()
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+from typing import Optional
+from math import radians, cos, sin, asin, sqrt
+
+from .types import Candidate, Cues
+
+
+def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Calculate the great circle distance between two points in kilometers."""
+    R = 6371  # Earth's radius in kilometers
+    
+    lat1 = radians(lat1)
+    lat2 = radians(lat2)
+    dlat = lat2 - lat1
+    dlon = radians(lon2 - lon1)
+    
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    c = 2 * asin(sqrt(a))
+    return R * c
+
+# Cue weights by presence bit. Bit 0 (languages) is special: its score scales with the
+# number of languages (0.15 each) against a fixed weight of 0.45 (3 languages = confident).
+_LANG_SCORE = 0.15
+_LANG_WEIGHT = 0.15 * 3
+_CUE_WEIGHTS = (
+    0.0,   # bit 0: languages_seen (handled via _LANG_SCORE/_LANG_WEIGHT)
+    0.1,   # bit 1: driving_side (strong binary indicator)
+    0.15,  # bit 2: road_markings (very reliable for region identification)
+    0.15,  # bit 3: signage_features
+    0.1,   # bit 4: vegetation_climate (good for region verification)
+    0.1,   # bit 5: electrical_infrastructure (development level and region)
+    0.05,  # bit 6: other_cues
+)
+# Location field weights by presence bit: country_code, admin1, admin2, nearest_city
+_LOCATION_WEIGHTS = (0.2, 0.3, 0.2, 0.3)
+
+
+def _build_cue_table() -> tuple[tuple[float, float], ...]:
+    """For every cue-presence mask: (score from non-language cues, 1 / total weight)."""
+    table = []
+    for mask in range(1 << len(_CUE_WEIGHTS)):
+        other = sum(w for bit, w in enumerate(_CUE_WEIGHTS) if mask >> bit & 1)
+        total = other + (_LANG_WEIGHT if mask & 1 else 0.0)
+        table.append((other, 1.0 / total if total > 0 else 0.0))
+    return tuple(table)
+
+
+def _build_location_table() -> tuple[float, ...]:
+    """For every location-presence mask: normalized location score times its 0.3 blend weight."""
+    table = []
+    for mask in range(1 << len(_LOCATION_WEIGHTS)):
+        present = sum(w for bit, w in enumerate(_LOCATION_WEIGHTS) if mask >> bit & 1)
+        # Score and weight accumulate the same terms, so the normalized score is simply 1.0
+        # when any field is present and 0.0 otherwise
+        location_score = 1.0 if present > 0 else 0.0
+        table.append(location_score * 0.3)
+    return tuple(table)
+
+
+_CUE_TABLE = _build_cue_table()
+_LOCATION_TABLE = _build_location_table()
+
+
+def calculate_cue_score(cues: Optional[Cues]) -> float:
+    """Calculate a score (0-1) based on the completeness and specificity of visual cues."""
+    if not cues:
+        return 0.0
+    langs = cues.languages_seen
+    mask = (
+        bool(langs)
+        | bool(cues.driving_side) << 1
+        | bool(cues.road_markings) << 2
+        | bool(cues.signage_features) << 3
+        | bool(cues.vegetation_climate) << 4
+        | bool(cues.electrical_infrastructure) << 5
+        | bool(cues.other_cues) << 6
+    )
+    other, inv_total = _CUE_TABLE[mask]
+    lang_score = len(langs) * _LANG_SCORE if langs else 0.0
+    return (lang_score + other) * inv_total
+
+
+def refine_confidence(candidate: Candidate) -> float:
+    """Calculate a refined confidence score based on multiple factors.
+
+    Weighted blend: 0.4 model confidence, 0.3 cue quality, 0.3 location specificity.
+    """
+    base_confidence = candidate.confidence if candidate.confidence is not None else 0.0
+    location_mask = (
+        bool(candidate.country_code)
+        | bool(candidate.admin1) << 1
+        | bool(candidate.admin2) << 2
+        | bool(candidate.nearest_city) << 3
+    )
+    final_confidence = (
+        base_confidence * 0.4
+        + calculate_cue_score(candidate.cues) * 0.3
+        + _LOCATION_TABLE[location_mask]
+    )
+    return min(1.0, final_confidence)
+
+
+def _normalize(s: Optional[str]) -> Optional[str]:
+    return s.strip().lower() if isinstance(s, str) else None
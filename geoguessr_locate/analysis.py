@@ -1,107 +1,19 @@
 from __future__ import annotations
 
-from typing import List, Optional, Tuple
-from math import radians, cos, sin, asin, sqrt
-
-from .types import ModelOutput, Candidate, FinalResult, Cues
-from .geocode import reverse_geocode, forward_geocode
-
-
-def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """Calculate the great circle distance between two points in kilometers."""
-    R = 6371  # Earth's radius in kilometers
-    
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a))
-    return R * c
-
-def calculate_cue_score(cues: Optional[Cues]) -> float:
-    """Calculate a score (0-1) based on the completeness and specificity of visual cues."""
-    if not cues:
-        return 0.0
-        
-    score = 0.0
-    total_weight = 0.0
-    
-    # Language identification (high weight as it's a strong regional indicator)
-    if cues.languages_seen:
-        score += len(cues.languages_seen) * 0.15
-        total_weight += 0.15 * 3  # Assuming max 3 languages is highly confident
-    
-    # Driving side (strong binary indicator)
-    if cues.driving_side:
-        score += 0.1
-        total_weight += 0.1
-    
-    # Road infrastructure (very reliable for region identification)
-    if cues.road_markings:
-        score += 0.15
-        total_weight += 0.15
-    if cues.signage_features:
-        score += 0.15
-        total_weight += 0.15
-    
-    # Environmental cues (good for region verification)
-    if cues.vegetation_climate:
-        score += 0.1
-        total_weight += 0.1
-    
-    # Infrastructure (helps narrow down development level and region)
-    if cues.electrical_infrastructure:
-        score += 0.1
-        total_weight += 0.1
-    
-    # Additional cues
-    if cues.other_cues:
-        score += 0.05
-        total_weight += 0.05
-    
-    # Normalize score
-    return score / total_weight if total_weight > 0 else 0.0
-
-def refine_confidence(candidate: Candidate) -> float:
-    """Calculate a refined confidence score based on multiple factors."""
-    base_confidence = candidate.confidence if candidate.confidence is not None else 0.0
-    
-    # Factor in the quality and quantity of visual cues
-    cue_score = calculate_cue_score(candidate.cues)
-    
-    # Consider the specificity of location data
-    location_score = 0.0
-    location_weight = 0.0
-    
-    if candidate.country_code:
-        location_score += 0.2
-        location_weight += 0.2
-    if candidate.admin1:
-        location_score += 0.3
-        location_weight += 0.3
-    if candidate.admin2:
-        location_score += 0.2
-        location_weight += 0.2
-    if candidate.nearest_city:
-        location_score += 0.3
-        location_weight += 0.3
-    
-    location_score = location_score / location_weight if location_weight > 0 else 0.0
-    
-    # Calculate final confidence as weighted average
-    final_confidence = (
-        base_confidence * 0.4 +  # Original model confidence
-        cue_score * 0.3 +        # Quality of visual cues
-        location_score * 0.3     # Specificity of location data
-    )
-    
-    return min(1.0, final_confidence)
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+from operator import attrgetter
+
+from .types import ModelOutput, Candidate, FinalResult
+from .geocode import Place, reverse_geocode, reverse_geocode_many, forward_geocode
+from ._scoring import haversine_distance, calculate_cue_score, refine_confidence, _normalize
 
 
 # Countries that predominantly drive on the left (ISO-3166 alpha-2)
 # Expanded for better contradiction checks
-LEFT_DRIVING = {
+LEFT_DRIVING = frozenset({
     # Europe
     "GB", "IE", "CY", "MT",
     # Oceania / Pacific
@@ -112,50 +24,57 @@ LEFT_DRIVING = {
     "ZA", "KE", "UG", "TZ", "BW", "NA", "ZM", "ZW", "LS", "SZ", "MU",
     # Americas / Caribbean
     "GY", "SR", "TT", "JM", "BB", "BS", "BM", "KY", "AG", "DM", "GD", "LC", "VC", "TC", "VG",
-}
+})
 
 # Countries using MPH on road signs (best-effort, not exhaustive)
 # Split by driving side because it helps disambiguate US vs GB and others
-MPH_RIGHT = {
+MPH_RIGHT = frozenset({
     "US",  # United States and territories
     "BZ",  # Belize
     "LR",  # Liberia
     # US territories commonly show MPH and drive on right
     "GU", "PR"
-}
-MPH_LEFT = {
+})
+MPH_LEFT = frozenset({
     "GB", "BS", "BB", "BM", "KY", "JM", "TT", "AG", "DM", "GD", "LC", "VC", "TC", "VG"
-}
+})
 MPH_ALL = MPH_RIGHT | MPH_LEFT
 
 
-def _expected_driving_side(country_code: str | None) -> str | None:
-    if not country_code:
-        return None
-    cc = country_code.upper()
-    if cc in LEFT_DRIVING:
-        return "left"
-    # default assumption if known but not left: right
-    if len(cc) == 2:
-        return "right"
-    return None
+# Known left-driving codes; any other two-letter code is assumed to drive on the right
+_SIDE_BY_CC: dict[str, str] = {cc: "left" for cc in LEFT_DRIVING}
 
 
-def contradiction_penalty(candidate: Candidate) -> float:
+def _expected_side_upper(cc: str) -> str | None:
+    """Expected driving side for an upper-cased country code, or None if it isn't a code."""
+    return _SIDE_BY_CC.get(cc, "right" if len(cc) == 2 else None)
+
+
+def contradiction_penalty(candidate: Candidate, cc: Optional[str] = None) -> float:
     """Return a small penalty for contradictions in cues vs country.
 
-    Currently: driving side mismatch.
+    Currently: driving side mismatch. ``cc`` may carry the candidate's
+    upper-cased country code when the caller has already computed it.
     """
     try:
         side = candidate.cues.driving_side if candidate.cues else None
     except Exception:
         side = None
-    expected = _expected_driving_side(candidate.country_code)
+    if cc is None:
+        cc = (candidate.country_code or "").upper()
+    expected = _expected_side_upper(cc)
     if side and expected and side != expected:
         return 0.08  # modest penalty
     return 0.0
 
 
+# Speed unit tokens; whitespace between parts is tolerated (e.g. "km / h", "miles per hour")
+_UNITS_RE = re.compile(
+    r"(?P<mph>mph|mi\s*/\s*h|miles\s*per\s*hour)|(?P<kmh>km\s*/\s*h|km\s*h|kph|kilometers\s*per\s*hour)",
+    re.I,
+)
+
+
 def _units_from_text(txt: Optional[str]) -> tuple[bool, bool]:
     """Detect presence of MPH or KM/H tokens in free text.
 
@@ -163,16 +82,22 @@ def _units_from_text(txt: Optional[str]) -> tuple[bool, bool]:
     """
     if not txt:
         return (False, False)
-    t = txt.lower().replace(" ", "")
-    mph = ("mph" in t) or ("mi/h" in t) or ("milesperhour" in t)
-    kmh = ("km/h" in t) or ("kmh" in t) or ("kph" in t) or ("kilometersperhour" in t)
+    mph, kmh = False, False
+    for m in _UNITS_RE.finditer(txt):
+        if m.group("mph"):
+            mph = True
+        else:
+            kmh = True
+        if mph and kmh:
+            break
     return (mph, kmh)
 
 
-def speed_units_adjustment(candidate: Candidate) -> float:
+def speed_units_adjustment(candidate: Candidate, cc: Optional[str] = None) -> float:
     """Adjust confidence based on detected speed units vs candidate country.
 
     Small boost when consistent, small penalty when contradictory. Conservative magnitudes.
+    ``cc`` is the optional pre-computed upper-cased country code.
     """
     cues = candidate.cues
     if not cues:
@@ -190,7 +115,8 @@ def speed_units_adjustment(candidate: Candidate) -> float:
     if not mph and not kmh:
         return 0.0
 
-    cc = (candidate.country_code or "").upper()
+    if cc is None:
+        cc = (candidate.country_code or "").upper()
     side = (cues.driving_side or "").lower() if cues.driving_side else None
 
     boost = 0.0
@@ -204,7 +130,7 @@ def speed_units_adjustment(candidate: Candidate) -> float:
 
     if kmh:
         # Penalize explicitly MPH-only strongholds if KM/H appears
-        if cc in {"US"}:
+        if cc == "US":
             boost -= 0.05
         # Mild boost otherwise (most of the world uses km/h)
         elif cc and cc not in MPH_RIGHT:
@@ -230,18 +156,16 @@ def radius_adjustment(candidate: Candidate) -> float:
     return 0.0
 
 
-def _normalize(s: Optional[str]) -> Optional[str]:
-    return s.strip().lower() if isinstance(s, str) else None
-
-
-def _geocode_consistency_adjust(candidate: Candidate) -> float:
+def _geocode_consistency_adjust(
+    candidate: Candidate, reverse: Callable[[float, float], Optional[Place]] = reverse_geocode
+) -> float:
     """Reverse geocode the candidate's lat/lon and compute a small adjustment.
 
     Also fills missing admin/city fields when possible. Returns a boost (or penalty).
     """
     if candidate.latitude is None or candidate.longitude is None:
         return 0.0
-    place = reverse_geocode(candidate.latitude, candidate.longitude)
+    place = reverse(candidate.latitude, candidate.longitude)
     if not place:
         return 0.0
 
@@ -282,16 +206,15 @@ def _cluster_adjustments(candidates: list[Candidate]) -> dict[int, float]:
     n = len(coords)
     if n < 2:
         return {}
-    # Precompute pairwise neighbor counts within 150 km
-    neighbors = {i: 0 for i, _ in coords}
-    for a in range(n):
-        ia, ca = coords[a]
-        for b in range(a + 1, n):
-            ib, cb = coords[b]
-            d = haversine_distance(ca.latitude or 0.0, ca.longitude or 0.0, cb.latitude or 0.0, cb.longitude or 0.0)
-            if d <= 150.0:
-                neighbors[ia] += 1
-                neighbors[ib] += 1
+    # Imported lazily: the optional Numba backend compiles its kernels on import
+    from ._kernels import neighbor_counts
+
+    counts = neighbor_counts(
+        [c.latitude or 0.0 for _, c in coords],
+        [c.longitude or 0.0 for _, c in coords],
+        150.0,
+    )
+    neighbors = {i: k for (i, _), k in zip(coords, counts)}
     adj: dict[int, float] = {}
     for i, _c in coords:
         k = neighbors.get(i, 0)
@@ -304,6 +227,13 @@ def _cluster_adjustments(candidates: list[Candidate]) -> dict[int, float]:
     return adj
 
 
+# Concurrent forward-geocode lookups per candidate during POI refinement
+POI_LOOKUP_WORKERS = 2
+
+_ROAD_RE = re.compile(r"\b((?:I|US|BR|SP|RN|A|M|N|D|E|R|CR|MX|CA|UK|NZ|ZA|IN|JP|TH|ID)[- ]?\d{1,4})\b", re.I)
+_PLACE_RE = re.compile(r"\b([A-ZÀ-ÿ][\wÀ-ÿ'’.-]+(?:\s+[A-ZÀ-ÿ][\wÀ-ÿ'’.-]+)+)\b")
+
+
 def _extract_poi_queries(candidate: Candidate, max_queries: int = 5) -> list[str]:
     """Extract potential POI/place/road queries from candidate textual fields.
 
@@ -322,16 +252,12 @@ def _extract_poi_queries(candidate: Candidate, max_queries: int = 5) -> list[str
     if not blob:
         return []
 
-    import re
-
-    # Road tokens
-    road_pattern = re.compile(r"\b((?:I|US|BR|SP|RN|A|M|N|D|E|R|CR|RN|MX|CA|UK|NZ|ZA|IN|JP|TH|ID)[- ]?\d{1,4})\b", re.I)
-    roads = set(m.group(1).strip() for m in road_pattern.finditer(blob))
+    # Road tokens, in order of appearance
+    roads = dict.fromkeys(m.group(1).strip() for m in _ROAD_RE.finditer(blob))
 
     # Place-like tokens: sequences of capitalized words (allow accents), length >= 2 words
     # Keep common street words to improve search (Rue, Rua, Calle, Av., Avenue, Road)
-    place_pattern = re.compile(r"\b([A-ZÀ-ÿ][\wÀ-ÿ'’.-]+(?:\s+[A-ZÀ-ÿ][\wÀ-ÿ'’.-]+)+)\b")
-    places_raw = [m.group(1).strip() for m in place_pattern.finditer(blob)]
+    places_raw = [m.group(1).strip() for m in _PLACE_RE.finditer(blob)]
     # Filter out overly generic phrases
     bad = {"Speed Limit", "No Parking", "City Center", "One Way", "Exit Only"}
     places = [p for p in places_raw if p not in bad and len(p) <= 60]
@@ -339,7 +265,7 @@ def _extract_poi_queries(candidate: Candidate, max_queries: int = 5) -> list[str
     # Deduplicate preserving order
     seen = set()
     queries: list[str] = []
-    for item in list(roads) + places:
+    for item in [*roads, *places]:
         key = item.lower()
         if key in seen:
             continue
@@ -367,34 +293,48 @@ def _poi_refine_candidate(candidate: Candidate, *, cache_country_bias: bool = Tr
         bias = (candidate.latitude, candidate.longitude)
 
     best = None
+    # Lookups are network-bound; fan them out (kept small since Nominatim is rate limited)
+    with ThreadPoolExecutor(max_workers=min(POI_LOOKUP_WORKERS, len(queries))) as ex:
+        futures = [
+            ex.submit(
+                forward_geocode,
+                q,
+                countrycodes=countrycodes,
+                bias=bias,
+                viewbox_km=100.0 if bias else None,
+                limit=5,
+            )
+            for q in queries
+        ]
+        results_lists = [f.result() for f in futures]
+
+    # The candidate side of every comparison is fixed; normalize it once
+    cand_country_n = _normalize(candidate.country_name) if candidate.country_name else None
+    cand_admin1_n = _normalize(candidate.admin1) if candidate.admin1 else None
+    if bias:
+        bias_lat, bias_lon = bias
+
     best_score = -1e9
-    for q in queries:
-        results = forward_geocode(
-            q,
-            countrycodes=countrycodes,
-            bias=bias,
-            viewbox_km=100.0 if bias else None,
-            limit=5,
-        )
+    for results in results_lists:
         if not results:
             continue
         for r in results:
             # Score candidate-r pair by multiple criteria
             score = 0.0
             # Country/admin consistency
-            if candidate.country_name and r.country:
-                if _normalize(candidate.country_name) == _normalize(r.country):
+            if cand_country_n is not None and r.country:
+                if cand_country_n == _normalize(r.country):
                     score += 2.0
                 else:
                     score -= 3.0
-            if candidate.admin1 and r.state:
-                if _normalize(candidate.admin1) == _normalize(r.state):
+            if cand_admin1_n is not None and r.state:
+                if cand_admin1_n == _normalize(r.state):
                     score += 1.0
                 else:
                     score -= 1.0
             # Distance from prior lat/lon if present
             if bias:
-                d = haversine_distance(bias[0], bias[1], r.lat, r.lon)
+                d = haversine_distance(bias_lat, bias_lon, r.lat, r.lon)
                 if d <= 10:
                     score += 3.0
                 elif d <= 30:
@@ -406,9 +346,11 @@ def _poi_refine_candidate(candidate: Candidate, *, cache_country_bias: bool = Tr
             # Prefer results with city info
             if r.city:
                 score += 0.3
-            # Slight preference for shorter display names (more specific)
+            # Slight preference for shorter display names (more specific); 0.6 - len/200, floored at 0
             if r.display_name:
-                score += max(0.0, 0.6 - min(0.6, len(r.display_name) / 200.0))
+                name_len = len(r.display_name)
+                if name_len < 120:
+                    score += 0.6 - name_len * 0.005
 
             if score > best_score:
                 best_score = score
@@ -433,7 +375,26 @@ def _poi_refine_candidate(candidate: Candidate, *, cache_country_bias: bool = Tr
     return 0.08
 
 
-def _consistency_boost_via_reverse_geocode(candidates: list[Candidate], do_reverse: bool) -> None:
+def _majority(values: list[str]) -> Optional[str]:
+    """Most frequent value, ties going to the first seen (like Counter.most_common(1)).
+
+    A plain dict tally: the lists here hold at most three entries.
+    """
+    counts: dict[str, int] = {}
+    for v in values:
+        counts[v] = counts.get(v, 0) + 1
+    best, best_n = None, 0
+    for v, n in counts.items():
+        if n > best_n:
+            best, best_n = v, n
+    return best
+
+
+def _consistency_boost_via_reverse_geocode(
+    candidates: list[Candidate],
+    do_reverse: bool,
+    reverse: Callable[[float, float], Optional[Place]] = reverse_geocode,
+) -> None:
     """Boost candidates consistent with majority reverse-geocoded region among top-3.
 
     Modifies candidates in-place by slightly increasing confidence for those
@@ -445,17 +406,14 @@ def _consistency_boost_via_reverse_geocode(candidates: list[Candidate], do_rever
     places = []
     for c in candidates[:3]:
         if c.latitude is not None and c.longitude is not None:
-            place = reverse_geocode(c.latitude, c.longitude)
+            place = reverse(c.latitude, c.longitude)
             if place:
                 places.append(place)
     if not places:
         return
     # Majority tallies
-    from collections import Counter
-    countries = Counter([p.country for p in places if p.country])
-    admins = Counter([p.state for p in places if p.state])
-    majority_country = countries.most_common(1)[0][0] if countries else None
-    majority_admin = admins.most_common(1)[0][0] if admins else None
+    majority_country = _majority([p.country for p in places if p.country])
+    majority_admin = _majority([p.state for p in places if p.state])
     if not majority_country and not majority_admin:
         return
     for c in candidates:
@@ -467,24 +425,69 @@ def _consistency_boost_via_reverse_geocode(candidates: list[Candidate], do_rever
         if boost:
             c.confidence = min(1.0, (c.confidence or 0.0) + boost)
 
+# Sort key for candidates; Candidate.confidence is a required float, so it is never None
+_BY_CONFIDENCE = attrgetter("confidence")
+
+
 def rank_and_finalize(image_path: str, model_name: str, raw: ModelOutput, top_k: int, do_reverse: bool) -> FinalResult:
-    # First, collect all candidates
+    # First, collect all candidates, most confident first by raw model confidence
     all_candidates: List[Candidate] = [raw.primary_guess] + list(raw.alternatives)
-
-    # Step 1: base refinement + local adjustments
+    all_candidates.sort(key=_BY_CONFIDENCE, reverse=True)
+
+    # Only the head can make it into the returned top-k; the tail keeps its raw confidence
+    # and stays ranked below, so it skips refinement and all network lookups.
+    K = max(top_k, 5)
+
+    # Reverse-geocode results for this call, keyed on 1e-5 degree integer bins (~1 m; cheaper
+    # to build and hash than round()ed floats); the same point is looked up by several steps
+    # below (only the returned strings are compared)
+    rg_cache: dict[tuple[int, int], Optional[Place]] = {}
+
+    def rg(lat: float, lon: float) -> Optional[Place]:
+        if not (math.isfinite(lat) and math.isfinite(lon)):
+            return None  # a NaN/inf guess can't be binned or looked up
+        key = (int(lat * 100000), int(lon * 100000))
+        if key not in rg_cache:
+            rg_cache[key] = reverse_geocode(lat, lon)
+        return rg_cache[key]
+
+    def rg_prefetch(cands: list[Candidate]) -> None:
+        points = [
+            (c.latitude, c.longitude)
+            for c in cands
+            if c.latitude is not None
+            and c.longitude is not None
+            and math.isfinite(c.latitude)
+            and math.isfinite(c.longitude)
+            and (int(c.latitude * 100000), int(c.longitude * 100000)) not in rg_cache
+        ]
+        for (lat, lon), place in zip(points, reverse_geocode_many(points)):
+            rg_cache[(int(lat * 100000), int(lon * 100000))] = place
+
+    tail = all_candidates[K:]
+    all_candidates = all_candidates[:K]
+
+    # Step 1: base refinement + local adjustments, accumulated in a local and written back
+    # once per candidate (each pydantic attribute assignment goes through __setattr__)
     for c in all_candidates:
-        c.confidence = refine_confidence(c)
+        conf = refine_confidence(c)
+        cc = (c.country_code or "").upper()  # upper-cased once, shared by the helpers below
         # Apply contradiction penalty (e.g., driving side)
-        pen = contradiction_penalty(c)
+        pen = contradiction_penalty(c, cc)
         if pen:
-            c.confidence = max(0.0, (c.confidence or 0.0) - pen)
+            conf = max(0.0, conf - pen)
         # Speed units and radius adjustments
-        c.confidence = min(1.0, max(0.0, (c.confidence or 0.0) + speed_units_adjustment(c) + radius_adjustment(c)))
+        c.confidence = min(1.0, max(0.0, conf + speed_units_adjustment(c, cc) + radius_adjustment(c)))
 
     # Optional Step 2: reverse-geocode per candidate to check consistency and enrich fields
+    # Remember which coordinates each candidate was enriched from (keyed by id)
+    enriched: dict[int, tuple[float, float]] = {}
     if do_reverse:
+        rg_prefetch(all_candidates[: max(3, top_k)])
         for c in all_candidates[: max(3, top_k)]:  # limit lookups for performance
-            adj = _geocode_consistency_adjust(c)
+            if c.latitude is not None and c.longitude is not None:
+                enriched[id(c)] = (c.latitude, c.longitude)
+            adj = _geocode_consistency_adjust(c, rg)
             if adj:
                 c.confidence = min(1.0, max(0.0, (c.confidence or 0.0) + adj))
 
@@ -506,22 +509,31 @@ def rank_and_finalize(image_path: str, model_name: str, raw: ModelOutput, top_k:
                 pass
 
     # Sort after adjustments
-    all_candidates.sort(key=lambda c: c.confidence if c.confidence is not None else 0.0, reverse=True)
+    all_candidates.sort(key=_BY_CONFIDENCE, reverse=True)
 
     # Optional Step 4: encourage consistency among top candidates using reverse geocoding majority, then re-rank
-    _consistency_boost_via_reverse_geocode(all_candidates, do_reverse)
-    all_candidates.sort(key=lambda c: c.confidence if c.confidence is not None else 0.0, reverse=True)
+    _consistency_boost_via_reverse_geocode(all_candidates, do_reverse, rg)
+    all_candidates.sort(key=_BY_CONFIDENCE, reverse=True)
+    all_candidates.extend(tail)
 
-    # Fix ranks
-    for i, c in enumerate(all_candidates, start=1):
+    # Fix ranks of the returned candidates
+    for i, c in enumerate(all_candidates[:top_k], start=1):
         c.rank = i
 
-    if do_reverse and all_candidates and all_candidates[0].latitude is not None and all_candidates[0].longitude is not None:
-        place = reverse_geocode(all_candidates[0].latitude, all_candidates[0].longitude)
+    # Final enrichment of the primary guess; skipped when Step 2 already filled its fields
+    # from the same coordinates (a POI snap may have moved it since)
+    if (
+        do_reverse
+        and all_candidates
+        and all_candidates[0].latitude is not None
+        and all_candidates[0].longitude is not None
+        and enriched.get(id(all_candidates[0])) != (all_candidates[0].latitude, all_candidates[0].longitude)
+    ):
+        place = rg(all_candidates[0].latitude, all_candidates[0].longitude)
         if place:
             # Fill missing admin/city using reverse-geocode and adjust confidence
             pg = all_candidates[0]
-            orig_completeness = sum(1 for x in [pg.country_name, pg.admin1, pg.admin2, pg.nearest_city] if x)
+            orig_completeness = bool(pg.country_name) + bool(pg.admin1) + bool(pg.admin2) + bool(pg.nearest_city)
             
             # Update missing fields
             pg.country_name = pg.country_name or place.country
@@ -530,7 +542,7 @@ def rank_and_finalize(image_path: str, model_name: str, raw: ModelOutput, top_k:
             pg.nearest_city = pg.nearest_city or place.city
             
             # Calculate how many fields were filled by reverse geocoding
-            new_completeness = sum(1 for x in [pg.country_name, pg.admin1, pg.admin2, pg.nearest_city] if x)
+            new_completeness = bool(pg.country_name) + bool(pg.admin1) + bool(pg.admin2) + bool(pg.nearest_city)
             completeness_improvement = (new_completeness - orig_completeness) / 4
             
             # Boost confidence slightly if reverse geocoding added significant data
@@ -1,9 +1,13 @@
 from __future__ import annotations
 
-import json
+import hashlib
+import os
+import threading
+from collections import OrderedDict
 from pathlib import Path
 from typing import Any, Optional
 
+import orjson
 from filelock import FileLock
 
 from .utils import get_cache_dir
@@ -13,31 +17,80 @@ class Cache:
     def __init__(self, cache_dir: Optional[Path] = None) -> None:
         self.root = cache_dir or get_cache_dir()
         self.root.mkdir(parents=True, exist_ok=True)
+        # Bounded in-memory LRU in front of the disk entries
+        self._mem: OrderedDict[str, Any] = OrderedDict()
+        self._mem_cap = 1024
+        self._mem_lock = threading.Lock()
 
-    def _path(self, key: str) -> Path:
-        return self.root / f"{key}.json"
+    def _path(self, key: str, suffix: str = ".json") -> Path:
+        # Shard into 256 subdirectories so no single directory grows unbounded
+        shard = hashlib.blake2b(key.encode("utf-8"), digest_size=1).hexdigest()
+        return self.root / shard / (key + suffix)
+
+    def _legacy_path(self, key: str) -> Path:
+        # Flat layout used before sharding
+        return self.root / (key + ".json")
+
+    def _remember(self, key: str, value: Any) -> None:
+        with self._mem_lock:
+            self._mem[key] = value
+            self._mem.move_to_end(key)
+            if len(self._mem) > self._mem_cap:
+                self._mem.popitem(last=False)
 
     def get(self, key: str) -> Optional[Any]:
-        p = self._path(key)
-        if not p.exists():
-            return None
-        try:
-            with p.open("r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            return None
+        with self._mem_lock:
+            if key in self._mem:
+                self._mem.move_to_end(key)
+                return self._mem[key]
+        # EAFP: a single open() instead of exists() + open() on every lookup
+        for p in (self._path(key), self._legacy_path(key)):
+            try:
+                with p.open("rb") as f:
+                    value = orjson.loads(f.read())
+            except FileNotFoundError:
+                continue
+            except Exception:
+                return None
+            self._remember(key, value)
+            return value
+        return None
 
     def set(self, key: str, value: Any) -> None:
         p = self._path(key)
+        p.parent.mkdir(exist_ok=True)
+        data = orjson.dumps(value)
+        # Write to a temp file and swap it in atomically so readers never see a partial
+        # entry; the lock only serializes concurrent writers.
+        tmp = p.with_suffix(".json.tmp")
         lock = FileLock(str(p) + ".lock")
         with lock:
-            with p.open("w", encoding="utf-8") as f:
-                json.dump(value, f, ensure_ascii=False, indent=2)
+            tmp.write_bytes(data)
+            os.replace(tmp, p)
+        self._remember(key, value)
 
-    def clear(self) -> None:
-        for item in self.root.glob("*.json"):
-            try:
-                item.unlink()
-            except Exception:
-                pass
+    # Raw binary entries (e.g. prepared image uploads), stored as-is next to the JSON ones
+    # and not kept in the in-memory layer
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        try:
+            return self._path(key, ".bin").read_bytes()
+        except OSError:
+            return None
+
+    def set_bytes(self, key: str, data: bytes) -> None:
+        p = self._path(key, ".bin")
+        p.parent.mkdir(exist_ok=True)
+        tmp = p.with_suffix(".bin.tmp")
+        with FileLock(str(p) + ".lock"):
+            tmp.write_bytes(data)
+            os.replace(tmp, p)
 
+    def clear(self) -> None:
+        with self._mem_lock:
+            self._mem.clear()
+        for pattern in ("*.json", "*.bin"):
+            for item in self.root.rglob(pattern):
+                try:
+                    item.unlink()
+                except Exception:
+                    pass
@@ -1,64 +1,31 @@
 from __future__ import annotations
 
-import json
 import os
+import sys
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
 import typer
-from rich.console import Console
-from rich.table import Table
 from dotenv import load_dotenv
 
-from .model_client import analyze_image, DEFAULT_MODEL
-from .analysis import rank_and_finalize
-from .cache import Cache
-from .types import FinalResult
+if TYPE_CHECKING:
+    from .types import FinalResult
 
-app = typer.Typer(add_completion=False, help="Guess a rough location from a GeoGuessr screenshot")
-console = Console()
+# Heavy modules (rich, the model SDKs, requests via geocoding) are imported inside the
+# functions that need them so argument parsing and --help stay fast
+app = typer.Typer(
+    add_completion=False,
+    rich_markup_mode=None,
+    help="Guess a rough location from a GeoGuessr screenshot",
+)
 
 
 def _print_human(result: FinalResult) -> None:
-    table = Table(title=f"Primary guess — model: {result.model}")
-    table.add_column("Rank", justify="right")
-    table.add_column("Confidence")
-    table.add_column("Country")
-    table.add_column("Region")
-    table.add_column("City")
-    table.add_column("Lat,Lon")
-    table.add_row(
-        str(result.primary_guess.rank),
-        f"{result.primary_guess.confidence:.2f}",
-        result.primary_guess.country_name or "?",
-        result.primary_guess.admin1 or "?",
-        result.primary_guess.nearest_city or "?",
-        (
-            f"{result.primary_guess.latitude:.3f}, {result.primary_guess.longitude:.3f}"
-            if result.primary_guess.latitude is not None and result.primary_guess.longitude is not None
-            else "?"
-        ),
-    )
-    console.print(table)
-
-    alt = Table(title="Top candidates")
-    alt.add_column("Rank", justify="right")
-    alt.add_column("Conf")
-    alt.add_column("Country")
-    alt.add_column("Region")
-    alt.add_column("City")
-    for c in result.top_k:
-        alt.add_row(
-            str(c.rank),
-            f"{c.confidence:.2f}",
-            c.country_name or "?",
-            c.admin1 or "?",
-            c.nearest_city or "?",
-        )
-    console.print(alt)
+    from rich.console import Console
+    from rich.table import Table
 
+    console = Console()
 
-def _print_human2(result: FinalResult) -> None:
     def _format_cues(cues) -> str:
         if not cues:
             return "—"
@@ -125,11 +92,14 @@ def _print_human2(result: FinalResult) -> None:
         console.print("[bold]Reasoning[/bold]")
         console.print(result.primary_guess.reasons)
 
+
 @app.command()
 def main(
     image: Path = typer.Argument(..., exists=True, readable=True, help="Path to screenshot"),
     top_k: int = typer.Option(5, min=1, max=10, help="Number of candidates to return"),
-    model: str = typer.Option(DEFAULT_MODEL, help="Gemini model name"),
+    model: Optional[str] = typer.Option(
+        None, help="Model name [default: $GEOGUESSR_LOCATE_MODEL or the Gemini default]"
+    ),
     json_out: Optional[Path] = typer.Option(None, help="Write full JSON to this file"),
     no_reverse_geocode: bool = typer.Option(False, help="Disable reverse geocoding"),
     clear_cache: bool = typer.Option(False, help="Clear local cache before running"),
@@ -138,6 +108,11 @@ def main(
     """Analyze IMAGE and print a rough location guess."""
     load_dotenv()  # allow .env
 
+    from .model_client import analyze_image, DEFAULT_MODEL
+    from .analysis import rank_and_finalize
+    from .cache import Cache
+
+    model = model or DEFAULT_MODEL
     cache = Cache()
     if clear_cache:
         cache.clear()
@@ -146,13 +121,15 @@ def main(
     final = rank_and_finalize(str(image), model, raw, top_k=top_k, do_reverse=not no_reverse_geocode)
 
     if json_only or json_out:
-        payload = json.loads(final.model_dump_json())
+        # Serialized once by pydantic; non-ASCII text is kept as UTF-8, not escaped
+        text = final.model_dump_json(indent=2)
         if json_only:
-            print(json.dumps(payload, ensure_ascii=False, indent=2))
+            sys.stdout.write(text)
+            sys.stdout.write("\n")
         if json_out:
-            json_out.write_text(json.dumps(payload, ensure_ascii=False, indent=2))
+            json_out.write_text(text, encoding="utf-8")
     else:
-        _print_human2(final)
+        _print_human(final)
 
 
 if __name__ == "__main__":
@@ -1,12 +1,21 @@
 from __future__ import annotations
 
+import atexit
+import hashlib
 import os
 import math
+import re
+import threading
 import time
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
 from typing import Optional, List
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from .cache import Cache
 
@@ -18,6 +27,30 @@ USER_AGENT = os.environ.get(
 )
 
 
+# (connect, read) timeouts for Nominatim requests
+_TIMEOUT = (3, 15)
+
+
+def _make_session() -> requests.Session:
+    """Shared session so consecutive lookups reuse one keep-alive TLS connection."""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        # Only retry connections that never reached the server: anything urllib3 re-sends
+        # inside the adapter bypasses _BUCKET and would break the 1 req/s policy. 5xx and read
+        # failures surface to the caller, which records a short-lived miss marker instead.
+        max_retries=Retry(total=3, connect=3, read=False, status=0, other=0, backoff_factor=0.5),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"User-Agent": USER_AGENT, "Accept-Encoding": "gzip"})
+    return session
+
+
+_SESSION = _make_session()
+
+
 @dataclass
 class Place:
     country: Optional[str]
@@ -38,67 +71,297 @@ class SearchPlace:
     display_name: Optional[str]
 
 
-def _rate_limit_gate(cache: Cache) -> None:
-    # simple 1 req/sec limiter using a timestamp file
-    ts_path = cache.root / "nominatim.last"
-    last = 0.0
-    if ts_path.exists():
+@dataclass
+class _TokenBucket:
+    """In-process rate limiter: bursts of up to `capacity` requests, refilled at `rate` per second."""
+
+    rate: float = 1.0
+    capacity: float = 1.0
+    tokens: float = 1.0
+    last: float = field(default_factory=time.monotonic)
+    last_request_wall: float = 0.0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def seed(self, last_request_wall: float) -> None:
+        """Resume from a request made at wall-clock time `last_request_wall` (e.g. by a previous run)."""
+        with self.lock:
+            elapsed = max(0.0, time.time() - last_request_wall)
+            self.tokens = min(self.capacity, self.tokens, elapsed * self.rate)
+            self.last = time.monotonic()
+            self.last_request_wall = max(self.last_request_wall, last_request_wall)
+
+    def acquire(self) -> None:
+        # Sleeping while holding the lock is intended: waiters queue up behind it
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens < 1.0:
+                time.sleep((1.0 - self.tokens) / self.rate)
+                self.last = time.monotonic()
+                self.tokens = 1.0
+            self.tokens -= 1.0
+            self.last_request_wall = time.time()
+
+
+# Concurrent geocode workers. The public Nominatim allows 1 req/s, so the default of 1 only
+# overlaps request preparation with the rate-limit wait; raise it for a self-hosted instance,
+# which also lets the bucket burst up to that many requests.
+WORKERS = max(1, int(os.environ.get("GEOGUESSR_LOCATE_WORKERS", "1") or 1))
+
+# Nominatim usage policy: at most 1 request per second
+_BUCKET = _TokenBucket(capacity=float(WORKERS), tokens=float(WORKERS))
+_EXECUTOR = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="geocode")
+_STAMP_LOCK = threading.Lock()
+_STAMP_PATH: Optional[Path] = None
+
+
+_CACHE: Optional[Cache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def _default_cache() -> Cache:
+    """Process-wide Cache used when callers don't pass one, so its in-memory layer is shared."""
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = Cache()
+    return _CACHE
+
+
+def _persist_last_request() -> None:
+    if _STAMP_PATH is not None and _BUCKET.last_request_wall:
         try:
-            last = float(ts_path.read_text().strip() or "0")
+            _STAMP_PATH.write_text(str(_BUCKET.last_request_wall))
         except Exception:
-            last = 0.0
-    now = time.time()
-    elapsed = now - last
-    if elapsed < 1.0:
-        time.sleep(1.0 - elapsed)
-    ts_path.write_text(str(time.time()))
+            pass
+
+
+def _rate_limit_gate(cache: Cache) -> None:
+    global _STAMP_PATH
+    if _STAMP_PATH is None:
+        with _STAMP_LOCK:
+            if _STAMP_PATH is None:
+                # Cold start: honour the last request of a previous process (read once),
+                # and hand our own last request time on to the next one at exit
+                stamp = cache.root / "nominatim.last"
+                try:
+                    _BUCKET.seed(float(stamp.read_text().strip() or "0"))
+                except Exception:
+                    pass
+                _STAMP_PATH = stamp
+                atexit.register(_persist_last_request)
+    _BUCKET.acquire()
+
+
+# Reverse results (zoom=10, i.e. ~10 km granularity) are cached on a 0.1 degree grid and
+# reused for any query within _REVERSE_REUSE_KM of the stored point, in its cell or the 8 around it
+_CELLS_PER_DEG = 10
+_REVERSE_REUSE_KM = 5.0
+
+
+def _cell(lat: float, lon: float) -> tuple[int, int]:
+    return (math.floor(lat * _CELLS_PER_DEG), math.floor(lon * _CELLS_PER_DEG))
+
+
+def _reverse_key(cy: int, cx: int) -> str:
+    return f"nom_{cy}_{cx}"
+
+
+def _approx_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Equirectangular distance approximation; accurate enough at a few km."""
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return 6371.0 * math.hypot(x, y)
+
+
+# Failed lookups are remembered briefly so retries don't pay the network timeout again
+_REVERSE_MISS_TTL = 600.0
+_SEARCH_MISS_TTL = 60.0
+
+
+def _miss_marker(ttl: float) -> dict:
+    return {"__miss__": True, "until": time.time() + ttl}
+
+
+def _is_fresh_miss(entry: object) -> bool:
+    return isinstance(entry, dict) and bool(entry.get("__miss__")) and entry.get("until", 0) > time.time()
+
+
+# Revalidation: when Nominatim sends ETag / Last-Modified, they are stored with the entry and
+# entries older than this are refreshed with a conditional request (a 304 costs no body).
+# Entries without validators are kept indefinitely, as before.
+_REVALIDATE_AFTER = 30 * 86400.0
+
+
+def _validators(resp: requests.Response) -> dict:
+    out = {}
+    if resp.headers.get("ETag"):
+        out["etag"] = resp.headers["ETag"]
+    if resp.headers.get("Last-Modified"):
+        out["last_modified"] = resp.headers["Last-Modified"]
+    if out:
+        out["fetched"] = time.time()
+    return out
+
+
+def _needs_revalidation(entry: dict) -> bool:
+    return ("etag" in entry or "last_modified" in entry) and (
+        time.time() - entry.get("fetched", 0) > _REVALIDATE_AFTER
+    )
+
+
+def _conditional_headers(entry: dict) -> dict:
+    headers = {}
+    if "etag" in entry:
+        headers["If-None-Match"] = entry["etag"]
+    if "last_modified" in entry:
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def _reverse_cached(lat: float, lon: float, cache: Cache) -> tuple[str, dict, Place] | None:
+    """Closest cached reverse result within _REVERSE_REUSE_KM, probing the 3x3 cell block.
+
+    Returns (cache key, stored entry, place) so the caller can revalidate the entry.
+    """
+    cy, cx = _cell(lat, lon)
+    best, best_d = None, _REVERSE_REUSE_KM
+    for dy in (0, -1, 1):
+        for dx in (0, -1, 1):
+            key = _reverse_key(cy + dy, cx + dx)
+            entry = cache.get(key)
+            if not isinstance(entry, dict) or "place" not in entry:
+                continue
+            try:
+                d = _approx_km(lat, lon, entry["lat"], entry["lon"])
+                if d < best_d:
+                    best, best_d = (key, entry, Place(**entry["place"])), d
+            except Exception:
+                continue
+    return best
+
+
+def _request_reverse(lat: float, lon: float, headers: Optional[dict] = None) -> requests.Response:
+    return _SESSION.get(
+        NOMINATIM_BASE,
+        params={
+            "lat": lat,
+            "lon": lon,
+            "format": "jsonv2",
+            "zoom": 10,
+            "addressdetails": 1,
+        },
+        headers=headers,
+        timeout=_TIMEOUT,
+    )
+
+
+def _place_from_reverse(data: dict) -> Place | None:
+    addr = data.get("address", {})
+    if not addr:
+        return None
+    return Place(
+        country=addr.get("country"),
+        state=addr.get("state") or addr.get("region"),
+        county=addr.get("county"),
+        city=addr.get("city") or addr.get("town") or addr.get("village"),
+        display_name=data.get("display_name"),
+    )
+
+
+def _revalidate_reverse(key: str, entry: dict, place: Place, cache: Cache) -> Place:
+    """Refresh a stale entry with a conditional request; keep serving it if that fails."""
+    _rate_limit_gate(cache)
+    try:
+        resp = _request_reverse(entry["lat"], entry["lon"], _conditional_headers(entry))
+        if resp.status_code != 304:
+            resp.raise_for_status()
+            fresh = _place_from_reverse(orjson.loads(resp.content))
+            if fresh is not None:
+                cache.set(key, {"lat": entry["lat"], "lon": entry["lon"], "place": fresh.__dict__, **_validators(resp)})
+                return fresh
+    except Exception:
+        pass
+    # Not modified (or unreachable): push the next check out by another period
+    cache.set(key, {**entry, "fetched": time.time()})
+    return place
 
 
 def reverse_geocode(lat: float, lon: float, cache: Optional[Cache] = None) -> Place | None:
-    cache = cache or Cache()
-    key = f"nominatim_{round(lat, 3)}_{round(lon, 3)}"
-    cached = cache.get(key)
-    if cached is not None:
-        return Place(**cached)
+    # NaN/inf from model output would make _cell raise; there is nothing to look up anyway
+    if not (math.isfinite(lat) and math.isfinite(lon)):
+        return None
+    cache = cache or _default_cache()
+    hit = _reverse_cached(lat, lon, cache)
+    if hit is not None:
+        hit_key, entry, place = hit
+        if _needs_revalidation(entry):
+            return _revalidate_reverse(hit_key, entry, place, cache)
+        return place
+    cy, cx = _cell(lat, lon)
+    key = _reverse_key(cy, cx)
+    miss_key = f"nom_miss_{cy}_{cx}"
+    if _is_fresh_miss(cache.get(miss_key)):
+        return None
 
     _rate_limit_gate(cache)
 
     try:
-        resp = requests.get(
-            NOMINATIM_BASE,
-            params={
-                "lat": lat,
-                "lon": lon,
-                "format": "jsonv2",
-                "zoom": 10,
-                "addressdetails": 1,
-            },
-            headers={"User-Agent": USER_AGENT},
-            timeout=15,
-        )
+        resp = _request_reverse(lat, lon)
         resp.raise_for_status()
-        data = resp.json()
-        addr = data.get("address", {})
-        place = Place(
-            country=addr.get("country"),
-            state=addr.get("state") or addr.get("region"),
-            county=addr.get("county"),
-            city=addr.get("city") or addr.get("town") or addr.get("village"),
-            display_name=data.get("display_name"),
-        )
-        cache.set(key, place.__dict__)
+        place = _place_from_reverse(orjson.loads(resp.content))
+        if place is None:
+            # e.g. open water: nothing to report, and asking again won't change that soon
+            cache.set(miss_key, _miss_marker(_REVERSE_MISS_TTL))
+            return None
+        cache.set(key, {"lat": lat, "lon": lon, "place": place.__dict__, **_validators(resp)})
         return place
     except Exception:
+        cache.set(miss_key, _miss_marker(_REVERSE_MISS_TTL))
         return None
 
 
+def reverse_geocode_many(
+    points: List[tuple[float, float]], cache: Optional[Cache] = None
+) -> List[Place | None]:
+    """Reverse geocode several (lat, lon) points through the shared worker pool, in order."""
+    cache = cache or _default_cache()
+    return list(_EXECUTOR.map(lambda p: reverse_geocode(p[0], p[1], cache), points))
+
+
+# cos(latitude) per whole degree. _deg_box looks up the next degree poleward, so below 89
+# degrees the box is never narrower than the exact one. The lookup is clamped at 89 degrees to
+# keep dlon finite, so from there to the pole the box is narrower than the exact (unbounded) one.
+_COS_LAT = tuple(math.cos(math.radians(d)) for d in range(91))
+
+
 def _deg_box(lat: float, lon: float, radius_km: float) -> tuple[float, float, float, float]:
     """Return a (min_lon, min_lat, max_lon, max_lat) viewbox around a point."""
     dlat = radius_km / 111.0
-    dlon = radius_km / max(1e-6, (111.0 * abs(math.cos(math.radians(lat)))))
+    dlon = radius_km / (111.0 * _COS_LAT[min(89, int(abs(lat)) + 1)])
     return (lon - dlon, lat - dlat, lon + dlon, lat + dlat)
 
 
+_NON_WORD_RE = re.compile(r"\W+")
+
+
+def _search_key(
+    query: str, countrycodes: Optional[str], vb: Optional[tuple], limit: int, address: bool = True
+) -> str:
+    """Stable cache key for a search: punctuation, case and spacing in the query don't matter.
+
+    The built-in hash() is salted per process, so it cannot key a cache that outlives a run.
+    """
+    cc_key = (countrycodes or "").lower()
+    vb_key = f"{round(vb[0],3)}_{round(vb[1],3)}_{round(vb[2],3)}_{round(vb[3],3)}" if vb else ""
+    canon = f"{_NON_WORD_RE.sub(' ', query).strip().lower()}|{cc_key}|{vb_key}|{limit}"
+    if not address:
+        canon += "|noaddr"
+    return "nom_search_" + hashlib.blake2b(canon.encode(), digest_size=10).hexdigest()
+
+
 def forward_geocode(
     query: str,
     *,
@@ -106,37 +369,49 @@ def forward_geocode(
     bias: Optional[tuple[float, float]] = None,
     viewbox_km: Optional[float] = None,
     limit: int = 5,
+    address: bool = True,
     cache: Optional[Cache] = None,
 ) -> List[SearchPlace]:
     """Search Nominatim for a textual place. Returns list of candidates.
 
     - countrycodes: comma-separated alpha-2 lower-case (e.g. "us,gb").
     - bias + viewbox_km: restrict search to a viewbox around bias point if provided.
+    - address: set False when only lat/lon are needed; Nominatim then skips the address
+      breakdown (smaller, cheaper responses) and the admin fields come back as None.
     """
-    cache = cache or Cache()
+    cache = cache or _default_cache()
     vb = None
-    if bias and viewbox_km and viewbox_km > 0:
-        vb = _deg_box(bias[0], bias[1], viewbox_km)
+    if bias and viewbox_km and viewbox_km > 0 and all(map(math.isfinite, (*bias, viewbox_km))):
+        # Snap the bias to the center of its grid cell so nearby biases share one cache entry
+        cy, cx = _cell(bias[0], bias[1])
+        vb = _deg_box((cy + 0.5) / _CELLS_PER_DEG, (cx + 0.5) / _CELLS_PER_DEG, viewbox_km)
 
-    # Build cache key
-    cc_key = countrycodes or ""
-    vb_key = f"_{round(vb[0],3)}_{round(vb[1],3)}_{round(vb[2],3)}_{round(vb[3],3)}" if vb else ""
-    key = f"nominatim_search_{hash((query.strip().lower(), cc_key, vb_key, limit))}"
+    key = _search_key(query, countrycodes, vb, limit, address)
     cached = cache.get(key)
-    if cached is not None:
+    if _is_fresh_miss(cached):
+        return []
+    # Results are stored as a plain list, or as {"results": [...], <validators>} when
+    # Nominatim sent ETag / Last-Modified
+    stale = cached if isinstance(cached, dict) and "results" in cached else None
+    rows = stale["results"] if stale else cached
+    hits = None
+    if isinstance(rows, list):
         try:
-            return [SearchPlace(**item) for item in cached]
+            hits = [SearchPlace(**item) for item in rows]
         except Exception:
-            pass
-
-    _rate_limit_gate(cache)
+            hits = None
+    if hits is not None and not (stale and _needs_revalidation(stale)):
+        return hits
+    if hits is None:
+        stale = None
 
     params = {
         "q": query,
         "format": "jsonv2",
-        "addressdetails": 1,
         "limit": max(1, min(10, limit)),
     }
+    if address:
+        params["addressdetails"] = 1
     if countrycodes:
         params["countrycodes"] = countrycodes.lower()
     if vb:
@@ -145,15 +420,20 @@ def forward_geocode(
         params["viewbox"] = f"{left},{top},{right},{bottom}"
         params["bounded"] = 1
 
+    _rate_limit_gate(cache)
+
     try:
-        resp = requests.get(
+        resp = _SESSION.get(
             "https://nominatim.openstreetmap.org/search",
             params=params,
-            headers={"User-Agent": USER_AGENT},
-            timeout=15,
+            headers=_conditional_headers(stale) if stale else None,
+            timeout=_TIMEOUT,
         )
+        if stale and resp.status_code == 304:
+            cache.set(key, {**stale, "fetched": time.time()})
+            return hits
         resp.raise_for_status()
-        data = resp.json()
+        data = orjson.loads(resp.content)
         results: List[SearchPlace] = []
         for item in data:
             addr = item.get("address", {})
@@ -173,9 +453,19 @@ def forward_geocode(
                     display_name=item.get("display_name"),
                 )
             )
-        # Cache a simple serializable representation
-        cache.set(key, [sp.__dict__ for sp in results])
+        # Cache a simple serializable representation; empty results only briefly
+        if results:
+            rows = [sp.__dict__ for sp in results]
+            validators = _validators(resp)
+            cache.set(key, {"results": rows, **validators} if validators else rows)
+        else:
+            cache.set(key, _miss_marker(_SEARCH_MISS_TTL))
         return results
     except Exception:
+        if stale:
+            # Keep serving the stored results; check again after another period
+            cache.set(key, {**stale, "fetched": time.time()})
+            return hits
+        cache.set(key, _miss_marker(_SEARCH_MISS_TTL))
         return []
 
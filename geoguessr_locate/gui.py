@@ -1,24 +1,97 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import os
+import sys
 import tempfile
 import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from html import escape as html_escape
 from pathlib import Path
 
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from dotenv import load_dotenv
-from PIL import Image, ImageTk, ImageGrab
+from PIL import Image
+from tenacity import RetryError
 import webbrowser
-import folium
 
+# model_client defers the Gemini and OpenAI SDKs itself; analysis (which pulls in requests)
+# and the Pillow grab/Tk modules are imported where they are first used
 from .model_client import analyze_image, DEFAULT_MODEL, DEFAULT_PROVIDER, GEMINI_DEFAULT_MODEL, OPENAI_DEFAULT_MODEL
-from .analysis import rank_and_finalize
 from .cache import Cache
 from .utils import get_cache_dir
 
 
+PREVIEW_SIZE = (720, 280)
+PREVIEW_PHOTOS_KEPT = 8
+
+
+@lru_cache(maxsize=8)
+def _preview_thumbnail(path: str, mtime_ns: int) -> Image.Image:
+    """Decode and downscale an image for the preview; cached per (path, mtime)."""
+    with Image.open(path) as im:
+        # Let the JPEG decoder scale down during decode (no-op for other formats)
+        im.draft("RGB", (PREVIEW_SIZE[0] * 2, PREVIEW_SIZE[1] * 2))
+        if im.mode != "RGB":
+            im = im.convert("RGB")
+        im.thumbnail(PREVIEW_SIZE, Image.Resampling.BILINEAR)
+        # Copy the (now small) image so it outlives the file being closed
+        return im.copy()
+
+
+def _save_temp_image(im: Image.Image, prefix: str) -> str:
+    """Write a pasted/captured image under the cache dir and return its path.
+
+    The upload is re-encoded as JPEG anyway, so a lossless PNG (slow to deflate for a
+    full screen) is only kept when the image has real transparency.
+    """
+    cache_dir = get_cache_dir()
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    if im.mode in ("RGBA", "LA") or (im.mode == "P" and "transparency" in im.info):
+        suffix, fmt, opts = ".png", "PNG", {"compress_level": 1}
+    else:
+        if im.mode not in ("RGB", "L"):
+            im = im.convert("RGB")
+        suffix, fmt, opts = ".jpg", "JPEG", {"quality": 90, "optimize": False, "progressive": False}
+    with tempfile.NamedTemporaryFile(prefix=prefix, suffix=suffix, dir=cache_dir, delete=False) as tmp:
+        im.save(tmp.name, format=fmt, **opts)
+    return tmp.name
+
+
+# Rendered map pages are kept under the cache dir, keyed by a hash of the result they show
+MAP_FILES_KEPT = 32
+
+
+def _js_text(text: str) -> str:
+    """JS string literal for model/Nominatim text inlined into the map's <script> block.
+
+    Leaflet renders tooltip strings as HTML, so the text is HTML-escaped first; "</" is then
+    escaped so nothing in it can close the script element early.
+    """
+    return json.dumps(html_escape(text)).replace("</", "<\\/")
+
+
+def _map_html_path(result: dict) -> Path:
+    digest = hashlib.blake2b(
+        json.dumps(result, sort_keys=True, default=str).encode("utf-8"), digest_size=8
+    ).hexdigest()
+    return get_cache_dir() / f"map_{digest}.html"
+
+
+def _sweep_map_files(keep: int = MAP_FILES_KEPT) -> None:
+    """Delete all but the `keep` most recently used map pages."""
+    try:
+        files = sorted(get_cache_dir().glob("map_*.html"), key=lambda p: p.stat().st_mtime)
+        for p in files[:-keep]:
+            p.unlink(missing_ok=True)
+    except OSError:
+        pass
+
+
 class App(ttk.Frame):
     def __init__(self, master: tk.Tk):
         super().__init__(master, padding=12)
@@ -128,6 +201,10 @@ class App(ttk.Frame):
         self.preview_label = ttk.Label(preview_frame)
         self.preview_label.pack(anchor=tk.W, padx=6, pady=6)
         self._preview_photo = None
+        # Bumped on every path change so in-flight preview decodes for older paths are dropped
+        self._preview_gen = 0
+        # (path, mtime_ns) -> PhotoImage for recently shown previews; also keeps them referenced
+        self._preview_lru: OrderedDict[tuple[str, int], object] = OrderedDict()
 
         row += 1
         # Results table
@@ -149,7 +226,11 @@ class App(ttk.Frame):
         self.clues_text.configure(state=tk.DISABLED)
 
         # Bindings
-        self.image_path.trace_add("write", lambda *_: self._load_preview())
+        # Debounced: typing a path shouldn't start a decode per keystroke
+        self._preview_after_id = None
+        self._preview_deferred = False
+        self.image_path.trace_add("write", self._on_path_change)
+        master.bind("<Map>", self._on_map, add="+")
         master.bind("<Return>", lambda _e: self._run())
         # macOS paste
         master.bind("<Command-v>", lambda _e: self._paste_image())
@@ -159,6 +240,11 @@ class App(ttk.Frame):
         master.bind("<F9>", lambda _e: self._capture_screen())
         master.bind("<Control-Shift-s>", lambda _e: self._capture_screen())
 
+        # Analyses run one at a time on a single reused worker thread
+        self._exec = ThreadPoolExecutor(max_workers=1, thread_name_prefix="analyze")
+        self._pending: Future | None = None
+        self._run_gen = 0
+
         # Global hotkeys (work even when minimized)
         self._hotkey_listener = None
         self._maybe_start_global_hotkeys()
@@ -177,6 +263,8 @@ class App(ttk.Frame):
     def _paste_image(self):
         # Try to pull image or file path from the clipboard
         try:
+            from PIL import ImageGrab
+
             data = ImageGrab.grabclipboard()
         except Exception as e:
             messagebox.showerror("Paste failed", f"Cannot read clipboard: {e}")
@@ -186,11 +274,7 @@ class App(ttk.Frame):
             return
         if isinstance(data, Image.Image):
             # Save to a temp file under cache dir
-            cache_dir = get_cache_dir()
-            cache_dir.mkdir(parents=True, exist_ok=True)
-            with tempfile.NamedTemporaryFile(prefix="pasted_", suffix=".png", dir=cache_dir, delete=False) as tmp:
-                data.convert("RGB").save(tmp.name, format="PNG")
-                self.image_path.set(tmp.name)
+            self.image_path.set(_save_temp_image(data, "pasted_"))
         elif isinstance(data, list) and data:
             # List of file paths
             self.image_path.set(str(data[0]))
@@ -200,6 +284,8 @@ class App(ttk.Frame):
     def _capture_screen(self):
         # Capture the entire screen (all monitors if supported) and run analysis
         try:
+            from PIL import ImageGrab
+
             try:
                 im = ImageGrab.grab(all_screens=True)
             except TypeError:
@@ -209,32 +295,75 @@ class App(ttk.Frame):
             messagebox.showerror("Capture failed", f"Cannot capture screen: {e}")
             return
         try:
-            cache_dir = get_cache_dir()
-            cache_dir.mkdir(parents=True, exist_ok=True)
-            with tempfile.NamedTemporaryFile(prefix="capture_", suffix=".png", dir=cache_dir, delete=False) as tmp:
-                im.convert("RGB").save(tmp.name, format="PNG")
-                self.image_path.set(tmp.name)
+            # Screen grabs are opaque even when returned as RGBA; never keep them as PNG
+            if im.mode not in ("RGB", "L"):
+                im = im.convert("RGB")
+            self.image_path.set(_save_temp_image(im, "capture_"))
         except Exception as e:
             messagebox.showerror("Capture failed", f"Cannot save capture: {e}")
             return
         # Automatically run analysis
         self._run()
 
+    def _on_path_change(self, *_):
+        if self._preview_after_id is not None:
+            self.master.after_cancel(self._preview_after_id)
+        self._preview_after_id = self.master.after(200, self._load_preview)
+
+    def _on_map(self, _e=None):
+        if self._preview_deferred:
+            self._preview_deferred = False
+            self.master.after(0, self._load_preview)
+
     def _load_preview(self):
+        self._preview_after_id = None
+        self._preview_gen += 1
         path = self.image_path.get().strip()
-        if not path or not Path(path).exists():
+        try:
+            key = (path, os.stat(path).st_mtime_ns) if path else None
+        except OSError:
+            key = None
+        if key is None:
             self.preview_label.configure(image="", text="")
             self._preview_photo = None
             return
+        if self.master.state() in ("iconic", "withdrawn") or not self.preview_label.winfo_ismapped():
+            # Minimized (typical for hotkey captures): build the preview once the window is back
+            self._preview_deferred = True
+            return
+        photo = self._preview_lru.get(key)
+        if photo is not None:
+            # Recently shown: swap the existing Tk image back in, no decode at all
+            self._preview_lru.move_to_end(key)
+            self._preview_photo = photo
+            self.preview_label.configure(image=photo, text="")
+            return
+        # Decoding a large capture can take a while; keep it off the Tk main loop
+        threading.Thread(target=self._decode_preview, args=(key, self._preview_gen), daemon=True).start()
+
+    def _decode_preview(self, key: tuple[str, int], gen: int):
         try:
-            im = Image.open(path)
-            im = im.convert("RGB")
-            im.thumbnail((720, 280))
-            self._preview_photo = ImageTk.PhotoImage(im)
-            self.preview_label.configure(image=self._preview_photo)
+            im = _preview_thumbnail(*key)
         except Exception as e:
-            self.preview_label.configure(text=f"Preview error: {e}")
+            self.master.after(0, lambda err=e: self._set_preview(key, gen, None, err))
+            return
+        self.master.after(0, lambda: self._set_preview(key, gen, im))
+
+    def _set_preview(self, key: tuple[str, int], gen: int, im, err: Exception | None = None):
+        # PhotoImage must be created on the main thread; drop results of superseded requests
+        if gen != self._preview_gen:
+            return
+        if im is None:
+            self.preview_label.configure(image="", text=f"Preview error: {err}")
             self._preview_photo = None
+            return
+        from PIL import ImageTk  # deferred until the first preview
+
+        self._preview_photo = ImageTk.PhotoImage(im)
+        self._preview_lru[key] = self._preview_photo
+        if len(self._preview_lru) > PREVIEW_PHOTOS_KEPT:
+            self._preview_lru.popitem(last=False)
+        self.preview_label.configure(image=self._preview_photo, text="")
 
     def _toggle_busy(self, busy: bool):
         if busy:
@@ -259,23 +388,40 @@ class App(ttk.Frame):
         self.tree.delete(*self.tree.get_children())
         self._last_result = None
 
+        # A newer request supersedes any queued one; a running one finishes but is ignored
+        if self._pending is not None:
+            self._pending.cancel()
+        self._run_gen += 1
+        gen = self._run_gen
+        # Read the Tk variables here, on the main thread
+        top_k = int(self.top_k.get())
+        model_name = self.model_name.get()
+        provider = self.provider.get()
+        do_reverse = bool(self.do_reverse.get())
+
+        def deliver(callback, arg):
+            if gen == self._run_gen:
+                callback(arg)
+
         def worker():
             try:
+                from .analysis import rank_and_finalize
+
                 cache = Cache()
                 raw = analyze_image(
                     str(p),
-                    top_k=int(self.top_k.get()),
-                    model_name=self.model_name.get(),
+                    top_k=top_k,
+                    model_name=model_name,
                     cache=cache,
-                    provider=self.provider.get(),
+                    provider=provider,
                 )
-                final = rank_and_finalize(str(p), self.model_name.get(), raw, top_k=int(self.top_k.get()), do_reverse=bool(self.do_reverse.get()))
-                payload = json.loads(final.model_dump_json())
-                self.master.after(0, lambda: self._display_result(payload))
+                final = rank_and_finalize(str(p), model_name, raw, top_k=top_k, do_reverse=do_reverse)
+                payload = final.model_dump(mode="json")
+                self.master.after(0, lambda: deliver(self._display_result, payload))
             except Exception as e:
                 # capture e in default arg so it remains bound when lambda runs
-                self.master.after(0, lambda err=e: self._error(err))
-        threading.Thread(target=worker, daemon=True).start()
+                self.master.after(0, lambda err=e: deliver(self._error, err))
+        self._pending = self._exec.submit(worker)
 
     def _display_result(self, payload):
         self._last_result = payload
@@ -293,8 +439,8 @@ class App(ttk.Frame):
             self._open_interactive_map()
         else:
             self.copy_coords_btn.configure(state=tk.DISABLED)
-        for c in payload.get("top_k", []):
-            self.tree.insert("", tk.END, values=(
+        rows = [
+            (
                 c.get("rank"),
                 f"{c.get('confidence',0):.2f}",
                 c.get("country_name") or "?",
@@ -302,7 +448,15 @@ class App(ttk.Frame):
                 c.get("nearest_city") or "?",
                 ("{:.3f}".format(c.get("latitude")) if c.get("latitude") is not None else "?"),
                 ("{:.3f}".format(c.get("longitude")) if c.get("longitude") is not None else "?"),
-            ))
+            )
+            for c in payload.get("top_k", [])
+        ]
+        # Hide the table while filling it so Tk lays it out and redraws once, not per row
+        self.tree.grid_remove()
+        self.tree.delete(*self.tree.get_children())
+        for values in rows:
+            self.tree.insert("", tk.END, values=values)
+        self.tree.grid()
         # Update clues panel for primary
         clues_txt = self._format_cues_text(pg.get("cues"))
         reasons = pg.get("reasons")
@@ -320,7 +474,6 @@ class App(ttk.Frame):
         # Unwrap tenacity RetryError to root cause if present
         root = e
         try:
-            from tenacity import RetryError  # type: ignore
             if isinstance(e, RetryError) and e.last_attempt and e.last_attempt.exception():
                 root = e.last_attempt.exception()
         except Exception:
@@ -346,6 +499,38 @@ class App(ttk.Frame):
 
     def _maybe_start_global_hotkeys(self):
         # Try to start a global hotkey listener so capture works when minimized
+        if sys.platform == "win32":
+            # Native hotkeys: the OS posts WM_HOTKEY, so the listener thread sleeps until pressed
+            threading.Thread(target=self._win_hotkey_loop, daemon=True).start()
+            return
+        self._start_pynput_hotkeys()
+
+    def _win_hotkey_loop(self):
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            user32 = ctypes.windll.user32
+            MOD_CONTROL, MOD_SHIFT, MOD_NOREPEAT = 0x0002, 0x0004, 0x4000
+            VK_F9, WM_HOTKEY = 0x78, 0x0312
+            # Registered from this thread, so WM_HOTKEY lands in this thread's message queue
+            registered = [
+                user32.RegisterHotKey(None, 1, MOD_NOREPEAT, VK_F9),
+                user32.RegisterHotKey(None, 2, MOD_CONTROL | MOD_SHIFT | MOD_NOREPEAT, ord("S")),
+            ]
+        except Exception:
+            registered = []
+        if not any(registered):
+            # e.g. another program owns these hotkeys; try the pynput listener instead
+            self.master.after(0, self._start_pynput_hotkeys)
+            return
+        self.master.after(0, lambda: self.status.set("Global hotkeys active: F9 or Ctrl+Shift+S"))
+        msg = wintypes.MSG()
+        while user32.GetMessageW(ctypes.byref(msg), None, 0, 0) > 0:
+            if msg.message == WM_HOTKEY:
+                self.master.after(0, self._capture_screen)
+
+    def _start_pynput_hotkeys(self):
         try:
             from pynput import keyboard as kb  # type: ignore
         except Exception:
@@ -364,6 +549,28 @@ class App(ttk.Frame):
             # If something goes wrong, just disable global hotkeys
             self._hotkey_listener = None
 
+    # Folium base map rendered once per process; markers are injected per result
+    _MAP_TEMPLATE: str | None = None
+    _MAP_NAME: str = ""
+    # From this many alternatives on, markers go into a Leaflet cluster group so only the
+    # visible clusters are materialized; small sets are added directly
+    _CLUSTER_MIN_MARKERS = 20
+
+    @classmethod
+    def _map_template(cls) -> tuple[str, str]:
+        if cls._MAP_TEMPLATE is None:
+            import folium  # deferred: slow to import and only needed once a map is opened
+            from folium.plugins import MarkerCluster
+
+            m = folium.Map(location=[0, 0], zoom_start=2, tiles="OpenStreetMap", control_scale=True)
+            # An empty cluster pulls the Leaflet.markercluster assets into the page header
+            MarkerCluster().add_to(m)
+            html = m.get_root().render()
+            head, sep, tail = html.rpartition("</html>")
+            cls._MAP_TEMPLATE = head + "<!--MARKERS-->\n" + sep + tail if sep else html + "<!--MARKERS-->"
+            cls._MAP_NAME = m.get_name()
+        return cls._MAP_TEMPLATE, cls._MAP_NAME
+
     def _open_interactive_map(self):
         if not self._last_result:
             return
@@ -372,21 +579,49 @@ class App(ttk.Frame):
         lon = pg.get("longitude")
         if lat is None or lon is None:
             return
-        # Build a Folium map with primary + alternatives
+        path = _map_html_path(self._last_result)
+        if path.exists():
+            # Same result as before: reopen its page, bumping mtime for the LRU sweep
+            os.utime(path)
+            webbrowser.open(path.as_uri())
+            return
+        # Reuse the pre-rendered Folium page and add primary + alternatives as Leaflet calls
+        template, map_name = self._map_template()
+        lat, lon = float(lat), float(lon)
         zoom = 6
-        m = folium.Map(location=[lat, lon], zoom_start=zoom, tiles="OpenStreetMap", control_scale=True)
-        folium.Marker([lat, lon], tooltip="Primary", icon=folium.Icon(color="red", icon="flag")).add_to(m)
+        js = [
+            f"var map = {map_name};",
+            f"map.setView([{lat}, {lon}], {zoom});",
+            f"L.marker([{lat}, {lon}], {{icon: L.AwesomeMarkers.icon("
+            '{icon: "flag", markerColor: "red", iconColor: "white", prefix: "glyphicon"})})'
+            '.bindTooltip("Primary").addTo(map);',
+        ]
         radius_km = pg.get("confidence_radius_km")
         if radius_km:
-            folium.Circle([lat, lon], radius=radius_km * 1000, color="#d23", fill=True, fill_opacity=0.15).add_to(m)
-        for c in self._last_result.get("top_k", [])[1:]:
-            la, lo = c.get("latitude"), c.get("longitude")
-            if la is None or lo is None:
-                continue
-            folium.Marker([la, lo], tooltip=f"#{c.get('rank')} {c.get('country_name') or ''}", icon=folium.Icon(color="blue")).add_to(m)
-        tmp = tempfile.NamedTemporaryFile(prefix="geolocate_map_", suffix=".html", delete=False)
-        m.save(tmp.name)
-        webbrowser.open(f"file://{tmp.name}")
+            js.append(
+                f"L.circle([{lat}, {lon}], "
+                f'{{radius: {float(radius_km) * 1000}, color: "#d23", fill: true, fillOpacity: 0.15}}).addTo(map);'
+            )
+        alternatives = [
+            c
+            for c in self._last_result.get("top_k", [])[1:]
+            if c.get("latitude") is not None and c.get("longitude") is not None
+        ]
+        # The primary marker and circle stay on the map itself so they are always visible
+        layer = "map"
+        if len(alternatives) >= self._CLUSTER_MIN_MARKERS:
+            js.append("var alts = L.markerClusterGroup().addTo(map);")
+            layer = "alts"
+        for c in alternatives:
+            tooltip = _js_text(f"#{c.get('rank')} {c.get('country_name') or ''}")
+            js.append(
+                f"L.marker([{float(c['latitude'])}, {float(c['longitude'])}], {{icon: L.AwesomeMarkers.icon("
+                '{icon: "info-sign", markerColor: "blue", iconColor: "white", prefix: "glyphicon"})})'
+                f".bindTooltip({tooltip}).addTo({layer});"
+            )
+        script = "<script>\n(function() {\n" + "\n".join(js) + "\n})();\n</script>"
+        path.write_text(template.replace("<!--MARKERS-->", script, 1), encoding="utf-8")
+        webbrowser.open(path.as_uri())
 
     def _copy_coords(self):
         if not self._primary_coords:
@@ -396,37 +631,32 @@ class App(ttk.Frame):
         self.master.clipboard_append(f"{lat:.6f},{lon:.6f}")
         self.status.set("Coordinates copied to clipboard")
 
+    # (cue field, label) in display order; languages_seen is the only list-valued field
+    _CUE_FIELDS = (
+        ("driving_side", "Driving"),
+        ("languages_seen", "Languages"),
+        ("signage_features", "Signage"),
+        ("road_markings", "Road"),
+        ("vegetation_climate", "Env"),
+        ("electrical_infrastructure", "Infra"),
+        ("other_cues", "Other"),
+    )
+
     def _format_cues_text(self, cues) -> str:
         if not cues:
             return "—"
         parts = []
-        ds = cues.get("driving_side")
-        if ds:
-            parts.append(f"Driving: {ds}")
-        langs = cues.get("languages_seen")
-        if isinstance(langs, list) and langs:
-            try:
-                parts.append("Languages: " + ", ".join(str(x) for x in langs))
-            except Exception:
-                pass
-        sf = cues.get("signage_features")
-        if sf:
-            parts.append(f"Signage: {sf}")
-        rm = cues.get("road_markings")
-        if rm:
-            parts.append(f"Road: {rm}")
-        vc = cues.get("vegetation_climate")
-        if vc:
-            parts.append(f"Env: {vc}")
-        ei = cues.get("electrical_infrastructure")
-        if ei:
-            parts.append(f"Infra: {ei}")
-        oc = cues.get("other_cues")
-        if oc:
-            parts.append(f"Other: {oc}")
+        for key, label in self._CUE_FIELDS:
+            value = cues.get(key)
+            if not value:
+                continue
+            if key == "languages_seen":
+                if not isinstance(value, list):
+                    continue
+                value = ", ".join(str(x) for x in value)
+            parts.append(f"{label}: {value}")
         return "\n".join(parts) or "—"
 
-
 def main():
     load_dotenv()  # load GOOGLE_API_KEY if present
     root = tk.Tk()
@@ -436,6 +666,7 @@ def main():
     except Exception:
         pass
     app = App(root)
+    threading.Thread(target=_sweep_map_files, daemon=True).start()
     root.minsize(820, 600)
     root.mainloop()
 
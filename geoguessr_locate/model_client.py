@@ -1,22 +1,34 @@
 ﻿from __future__ import annotations
 
-import json
+import asyncio
+import hashlib
 import os
-from typing import List
-
-import google.generativeai as genai
-try:  # optional dependency
-    from openai import OpenAI  # type: ignore
-except Exception:  # pragma: no cover - openai may not be installed in minimal env
-    OpenAI = None  # type: ignore
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Optional
+
+import orjson
+from tenacity import (
+    retry,
+    retry_if_exception_type,
+    retry_if_not_exception_type,
+    stop_after_attempt,
+    wait_random_exponential,
+)
 from pydantic import ValidationError
 
-from .utils import load_image_bytes, sha256_file
-from .ocr import extract_ocr_text
+from .utils import b64_data_url, ensure_image_path, load_image_bytes, read_and_hash, sniff_mime
+from .ocr import extract_ocr_text, ocr_available
 from .cache import Cache
-from .prompts import SYSTEM_PROMPT, USER_PROMPT_TEMPLATE, USER_PROMPT_TEMPLATE_OPENAI, PROMPT_VERSION
-from .types import ModelOutput, Candidate
+from .prompts import SYSTEM_PROMPT, PROMPT_VERSION, render_user_prompt
+from .types import ModelOutput, Candidate, Cues
+
+if TYPE_CHECKING:
+    import google.generativeai as genai
 
 
 GEMINI_DEFAULT_MODEL = os.environ.get("GEOGUESSR_LOCATE_GEMINI_MODEL", "gemini-2.5-flash-lite")
@@ -25,31 +37,146 @@ DEFAULT_PROVIDER = os.environ.get("GEOGUESSR_LOCATE_PROVIDER", "gemini")  # gemi
 # Backwards compatible single default
 DEFAULT_MODEL = os.environ.get("GEOGUESSR_LOCATE_MODEL", GEMINI_DEFAULT_MODEL)
 
+# Uploads are downscaled to this long edge and re-encoded; vision models resize large inputs
+# internally anyway, so full-resolution captures only cost bandwidth and input tokens
+UPLOAD_MAX_SIDE = 1536
+UPLOAD_QUALITY = 85
+# Upper bound on generated tokens per call, so a runaway response can't stall the pipeline.
+# Roomy on purpose: the JSON for 10 candidates with reasons fits well within it, and for
+# reasoning models (gpt-5-*) the budget also covers the hidden reasoning tokens.
+MAX_OUTPUT_TOKENS = int(os.environ.get("GEOGUESSR_LOCATE_MAX_OUTPUT_TOKENS", "8192") or 8192)
+
+
+# (abs path, mtime_ns, size) -> image hash, so re-analyzing an unchanged file skips hashing.
+# Also persisted in the cache under "imghash_*" so the fast path survives restarts.
+_HASH_MEMO: OrderedDict[tuple[str, int, int], str] = OrderedDict()
+_HASH_MEMO_CAP = 256
+_HASH_MEMO_LOCK = threading.Lock()
+
+
+def _image_hash(image_path: str, cache: Cache) -> tuple[str, bytes | None]:
+    """Return (image hash, raw bytes if the file had to be read to compute it)."""
+    path = os.path.abspath(image_path)
+    try:
+        st = os.stat(path)
+    except OSError:
+        st = None
+    if st is not None:
+        stamp = (path, st.st_mtime_ns, st.st_size)
+        with _HASH_MEMO_LOCK:
+            known = _HASH_MEMO.get(stamp)
+        if known is not None:
+            return known, None
+        disk_key = "imghash_" + hashlib.blake2b(path.encode("utf-8"), digest_size=10).hexdigest()
+        entry = cache.get(disk_key)
+        if isinstance(entry, dict) and entry.get("mtime_ns") == st.st_mtime_ns and entry.get("size") == st.st_size:
+            _remember_hash(stamp, entry["hash"])
+            return entry["hash"], None
+    img_hash, raw_bytes = read_and_hash(image_path)
+    if st is not None:
+        _remember_hash(stamp, img_hash)
+        cache.set(disk_key, {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "hash": img_hash})
+    return img_hash, raw_bytes
+
+
+def _remember_hash(stamp: tuple[str, int, int], img_hash: str) -> None:
+    with _HASH_MEMO_LOCK:
+        _HASH_MEMO[stamp] = img_hash
+        _HASH_MEMO.move_to_end(stamp)
+        if len(_HASH_MEMO) > _HASH_MEMO_CAP:
+            _HASH_MEMO.popitem(last=False)
+
+
+def _genai():
+    # The Gemini SDK (protobuf, grpc) is slow to import; load it on the first Gemini call
+    import google.generativeai as genai
+
+    return genai
+
+
+def _upload_bytes(image_path: str, img_hash: str, raw_bytes: bytes | None, cache: Cache) -> bytes:
+    """Downscaled upload JPEG, cached on disk so retries and other models/top_k reuse it."""
+    key = f"upload_{img_hash}_{UPLOAD_MAX_SIDE}q{UPLOAD_QUALITY}"
+    data = cache.get_bytes(key)
+    if data is not None:
+        return data
+    if raw_bytes is None:
+        raw_bytes = ensure_image_path(image_path).read_bytes()
+    data = load_image_bytes(raw_bytes, max_side=UPLOAD_MAX_SIDE, quality=UPLOAD_QUALITY)
+    # A passed-through JPEG is just the original file; no point storing a second copy
+    if data is not raw_bytes:
+        cache.set_bytes(key, data)
+    return data
+
 
 def _configure_gemini() -> None:
     api_key = os.environ.get("GOOGLE_API_KEY")
     if not api_key:
-        raise RuntimeError("GOOGLE_API_KEY not set. Set it in env or .env")
-    genai.configure(api_key=api_key)
+        raise ConfigError("GOOGLE_API_KEY not set. Set it in env or .env")
+    _configure_gemini_key(api_key)
+
+
+@lru_cache(maxsize=1)
+def _configure_gemini_key(api_key: str) -> None:
+    # Only reconfigure the SDK when the key actually changes
+    _genai().configure(api_key=api_key)
+
+
+GEMINI_GENERATION_CONFIG = {
+    "temperature": 0.15,
+    "top_p": 0.7,
+    "top_k": 40,
+    "response_mime_type": "application/json",
+    "max_output_tokens": MAX_OUTPUT_TOKENS,
+}
+
+
+@lru_cache(maxsize=8)
+def _gemini_model(model_name: str, system: str, config_key: tuple) -> "genai.GenerativeModel":
+    """Reuse one GenerativeModel per (model, system prompt, config), including across retries."""
+    return _genai().GenerativeModel(
+        model_name=model_name,
+        system_instruction=system,
+        generation_config=dict(config_key),
+    )
 
 
 def _configure_openai():  # -> OpenAI
-    if OpenAI is None:
-        raise RuntimeError("openai package not installed. Install with pip install openai")
+    # Like the Gemini SDK, the openai package (httpx, its typed models) is only imported
+    # once an OpenAI call is made, so the GUI/CLI can import this module cheaply
+    try:  # optional dependency
+        from openai import OpenAI  # type: ignore
+    except Exception:  # pragma: no cover - openai may not be installed in minimal env
+        raise ConfigError("openai package not installed. Install with pip install openai")
     api_key = os.environ.get("OPENAI_API_KEY")
     if not api_key:
-        raise RuntimeError("OPENAI_API_KEY not set. Set it in env or .env")
-    return OpenAI(api_key=api_key)
+        raise ConfigError("OPENAI_API_KEY not set. Set it in env or .env")
+    # Retries are handled by the tenacity decorator on analyze_image; don't stack the SDK's own
+    return OpenAI(api_key=api_key, timeout=60, max_retries=0)
+
+
+# OCR runs that returned nothing are retried after this long (see analyze_image)
+_OCR_MISS_TTL = 600.0
+
+
+def _is_fresh_ocr_miss(entry: object) -> bool:
+    return isinstance(entry, dict) and bool(entry.get("__miss__")) and entry.get("until", 0) > time.time()
 
 
 class JsonParseError(RuntimeError):
     pass
 
 
+class ConfigError(RuntimeError):
+    """Setup problem (missing key, package or unknown provider); retrying can't fix it."""
+
+
+# Jittered backoff so bursts of failing calls (e.g. rate limits) don't retry in lockstep
 @retry(
-    wait=wait_exponential(multiplier=1, min=2, max=20),
-    stop=stop_after_attempt(3),
-    retry=retry_if_exception_type((JsonParseError, RuntimeError)),
+    wait=wait_random_exponential(multiplier=1, max=60),
+    stop=stop_after_attempt(5),
+    retry=retry_if_exception_type((JsonParseError, RuntimeError, TimeoutError))
+    & retry_if_not_exception_type(ConfigError),
 )
 def analyze_image(
     image_path: str,
@@ -67,13 +194,20 @@ def analyze_image(
     """
     provider = provider.lower()
     cache = cache or Cache()
-    img_hash = sha256_file(image_path)[:16]
-    cache_key = f"{provider}_{model_name}_{PROMPT_VERSION}_{top_k}_{img_hash}"
+    # One read serves both the cache key and the upload; none at all for a known unchanged file
+    img_hash, raw_bytes = _image_hash(image_path, cache)
+    cache_key = f"{provider}_{model_name}_{PROMPT_VERSION}_{top_k}_{UPLOAD_MAX_SIDE}q{UPLOAD_QUALITY}_{img_hash}"
     cached = cache.get(cache_key)
     if cached is not None:
+        # We only ever store a dump of an already-validated output, so rebuild it without
+        # re-validating; fall back to full validation for entries from an older schema
         try:
-            return ModelOutput(**cached)
-        except ValidationError:
+            data = orjson.loads(cached) if isinstance(cached, str) else cached
+            try:
+                return _construct_output(data)
+            except (AttributeError, KeyError, TypeError):
+                return ModelOutput.model_validate(data)
+        except (orjson.JSONDecodeError, ValidationError):
             pass
 
     # Adjust model default dynamically if caller didn't override and provider switched
@@ -82,27 +216,34 @@ def analyze_image(
     elif provider == "gemini" and model_name == DEFAULT_MODEL and model_name.startswith("gpt"):
         model_name = GEMINI_DEFAULT_MODEL
 
-    image_bytes = load_image_bytes(image_path)
-    ocr_text = extract_ocr_text(image_path) or "" if use_ocr else ""
+    # OCR depends only on the image, so one run serves every model/provider/top_k combination
+    ocr_key = f"ocr_{img_hash}"
+    ocr_cached = cache.get(ocr_key) if use_ocr else None
+    # OCR and the upload re-encode work on independent data and both release the GIL in
+    # their C code, so run OCR in the background while the upload bytes are prepared
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        run_ocr = use_ocr and not isinstance(ocr_cached, str) and not _is_fresh_ocr_miss(ocr_cached)
+        ocr_future = ex.submit(extract_ocr_text, image_path) if run_ocr else None
+        image_bytes = _upload_bytes(image_path, img_hash, raw_bytes, cache)
+        if ocr_future is not None:
+            ocr_text = ocr_future.result()
+            if ocr_text is not None:
+                cache.set(ocr_key, ocr_text)
+            elif ocr_available():
+                # None is both "no text found" and a failure (missing binary, timeout), so
+                # only remember it briefly rather than as a permanent empty result
+                cache.set(ocr_key, {"__miss__": True, "until": time.time() + _OCR_MISS_TTL})
+            ocr_text = ocr_text or ""
+        else:
+            ocr_text = ocr_cached if use_ocr and isinstance(ocr_cached, str) else ""
     system = SYSTEM_PROMPT
-    base_template = USER_PROMPT_TEMPLATE_OPENAI if provider == "openai" else USER_PROMPT_TEMPLATE
-    user = base_template.replace("<<TOP_K_MINUS_1>>", str(max(1, top_k - 1)))
-    user = user.replace("<<OCR_TEXT>>", ocr_text or "(none)")
+    user = render_user_prompt(provider, top_k, ocr_text)
 
     if provider == "gemini":
         _configure_gemini()
-        model = genai.GenerativeModel(
-            model_name=model_name,
-            system_instruction=system,
-            generation_config={
-                "temperature": 0.15,
-                "top_p": 0.7,
-                "top_k": 40,
-                "response_mime_type": "application/json",
-            },
-        )
+        model = _gemini_model(model_name, system, tuple(sorted(GEMINI_GENERATION_CONFIG.items())))
         content = [
-            {"mime_type": "image/jpeg", "data": image_bytes},
+            {"mime_type": sniff_mime(image_bytes), "data": image_bytes},
             user,
         ]
         try:
@@ -113,15 +254,14 @@ def analyze_image(
     elif provider == "openai":
         client = _configure_openai()
         # OpenAI images: send base64 data url or bytes via content array
-        import base64
-        b64 = base64.b64encode(image_bytes).decode("utf-8")
+        data_url = b64_data_url(image_bytes)
         messages = [
             {"role": "system", "content": system},
             {
                 "role": "user",
                 "content": [
                     {"type": "text", "text": user},
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64}"}},
+                    {"type": "image_url", "image_url": {"url": data_url}},
                 ],
             },
         ]
@@ -131,6 +271,7 @@ def analyze_image(
                 model=model_name,
                 messages=messages,
                 response_format={"type": "json_object"},
+                max_completion_tokens=MAX_OUTPUT_TOKENS,
             )
         except Exception as first_err:
             # Fallback: try without forcing response_format (some preview models may not support it)
@@ -138,59 +279,133 @@ def analyze_image(
                 completion = client.chat.completions.create(
                     model=model_name,
                     messages=messages,
+                    max_completion_tokens=MAX_OUTPUT_TOKENS,
                 )
             except Exception:
                 raise RuntimeError(f"OpenAI call failed: {first_err}")
         text = completion.choices[0].message.content or ""
     else:
-        raise RuntimeError(f"Unknown provider '{provider}'. Use 'gemini' or 'openai'.")
+        raise ConfigError(f"Unknown provider '{provider}'. Use 'gemini' or 'openai'.")
 
     try:
         data = _parse_model_json(text)
-        output = ModelOutput(**data)
+        output = ModelOutput.model_validate(data)
         _sanitize_precision(output)
     except Exception as e:
         raise JsonParseError(f"Failed to parse model JSON: {e}")
 
-    cache.set(cache_key, json.loads(output.model_dump_json()))
+    cache.set(cache_key, output.model_dump_json())
     return output
 
 
+async def analyze_image_async(image_path: str, **kwargs) -> ModelOutput:
+    """analyze_image on a worker thread, for use from asyncio code (same keyword arguments)."""
+    return await asyncio.to_thread(analyze_image, image_path, **kwargs)
+
+
+async def analyze_images_batch(
+    image_paths: List[str], concurrency: int = 8, **kwargs
+) -> List[ModelOutput | BaseException]:
+    """Analyze several images with up to `concurrency` model calls in flight.
+
+    Results come back in input order; a failed image yields its exception instead of
+    aborting the batch. Remaining keyword arguments are passed to analyze_image.
+    """
+    kwargs.setdefault("cache", Cache())  # share one cache (and its memory layer) across the batch
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(path: str) -> ModelOutput:
+        async with sem:
+            return await analyze_image_async(path, **kwargs)
+
+    return await asyncio.gather(*(one(p) for p in image_paths), return_exceptions=True)
+
+
+_OUTPUT_FIELDS = frozenset(ModelOutput.model_fields)
+_CANDIDATE_FIELDS = frozenset(Candidate.model_fields)
+_CUES_FIELDS = frozenset(Cues.model_fields)
+
+
+def _check_fields(d: dict, fields: frozenset[str]) -> None:
+    # model_dump() always writes every field, so any other key set means the entry was written
+    # under a different schema; model_construct would accept it silently
+    if d.keys() != fields:
+        raise KeyError("cached entry does not match the current schema")
+
+
+def _construct_candidate(d: dict) -> Candidate:
+    _check_fields(d, _CANDIDATE_FIELDS)
+    cues = d["cues"]
+    if cues is not None:
+        _check_fields(cues, _CUES_FIELDS)
+        cues = Cues.model_construct(**cues)
+    return Candidate.model_construct(**{**d, "cues": cues})
+
+
+def _construct_output(d: dict) -> ModelOutput:
+    """Rebuild a cached ModelOutput dump without validation (model_construct is not recursive).
+
+    Raises KeyError/TypeError if the entry doesn't have exactly the current fields.
+    """
+    _check_fields(d, _OUTPUT_FIELDS)
+    return ModelOutput.model_construct(
+        primary_guess=_construct_candidate(d["primary_guess"]),
+        alternatives=[_construct_candidate(c) for c in d["alternatives"]],
+    )
+
+
+def _first_json_object(text: str) -> Optional[str]:
+    """Return the first balanced {...} block in text, found in a single pass.
+
+    Tracks string/escape state so braces inside string values don't count.
+    """
+    start = text.find("{")
+    if start == -1:
+        return None
+    depth = 0
+    in_string = escape = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start : i + 1]
+    return None
+
+
 def _parse_model_json(text: str) -> dict:
     """Parse model output into JSON dict with light recovery.
 
-    - Tries direct json.loads
-    - Strips markdown code fences if present
-    - Extracts first {...} block as fallback
+    - Tries a direct parse
+    - Strips a surrounding markdown code fence
+    - Extracts the first balanced {...} block as fallback
     """
     # Direct parse
     try:
-        return json.loads(text)
-    except Exception:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
         pass
-    # Strip markdown code fences
-    if "```" in text:
-        stripped = text
-        # remove ```json or ``` fences
-        stripped = stripped.replace("```json", "```")
-        parts = stripped.split("```")
-        # pick the largest fenced block as likely JSON
-        if len(parts) >= 3:
-            candidates = [p for i, p in enumerate(parts) if i % 2 == 1]
-            if candidates:
-                largest = max(candidates, key=lambda s: len(s))
-                try:
-                    return json.loads(largest)
-                except Exception:
-                    text = largest
-    # Find first/last braces fallback
-    start = text.find("{")
-    end = text.rfind("}")
-    if start != -1 and end != -1 and end > start:
-        snippet = text[start : end + 1]
-        return json.loads(snippet)
-    # Give up
-    return json.loads(text)
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[-1].rsplit("```", 1)[0]
+    snippet = _first_json_object(text)
+    # Give up with orjson's own error when there's nothing balanced to extract
+    return orjson.loads(snippet if snippet is not None else text)
+
+
+# Explicit road/route identifiers that justify keeping precise coordinates without a radius
+_ROUTE_PATTERN = re.compile(r"\b(I-?\d+|US ?\d+|A\d+|E\d+|M\d+|BR-?\d+|SP-?\d+|N\d+|D\d+|R\d+)\b", re.I)
 
 
 def _sanitize_precision(output: ModelOutput) -> None:
@@ -200,9 +415,6 @@ def _sanitize_precision(output: ModelOutput) -> None:
     - If coords present but radius missing, set a conservative minimum (25km)
       unless reasons mention an explicit road/route pattern.
     """
-    import re
-
-    route_pattern = re.compile(r"\b(I-?\d+|US ?\d+|A\d+|E\d+|M\d+|BR-?\d+|SP-?\d+|N\d+|D\d+|R\d+)\b", re.I)
 
     def adjust(c: Candidate) -> None:
         if c.latitude is None or c.longitude is None:
@@ -213,7 +425,7 @@ def _sanitize_precision(output: ModelOutput) -> None:
             c.longitude = None
             return
         if r is None:
-            if not route_pattern.search(c.reasons or ""):
+            if not _ROUTE_PATTERN.search(c.reasons or ""):
                 c.confidence_radius_km = 25.0
 
     adjust(output.primary_guess)
@@ -5,10 +5,22 @@ from typing import Optional
 
 try:
     import pytesseract  # type: ignore
-    from PIL import Image
+    from PIL import Image, ImageOps
 except Exception:  # pragma: no cover - optional dependency
     pytesseract = None  # type: ignore
     Image = None  # type: ignore
+    ImageOps = None  # type: ignore
+
+# Street scenes hold scattered bits of sign text rather than a page of it: sparse-text
+# segmentation (psm 11) finds them faster than page layout analysis; give up on pathological
+# inputs instead of stalling the analysis
+TESSERACT_CONFIG = "--psm 11"
+TESSERACT_TIMEOUT = 5
+
+
+def ocr_available() -> bool:
+    """True if pytesseract and Pillow imported; the tesseract binary itself isn't probed."""
+    return pytesseract is not None and Image is not None
 
 
 def extract_ocr_text(image_path: str | Path, max_chars: int = 2000) -> Optional[str]:
@@ -25,8 +37,11 @@ def extract_ocr_text(image_path: str | Path, max_chars: int = 2000) -> Optional[
         if not p.exists():
             return None
         with Image.open(p) as im:
-            rgb = im.convert("RGB")
-            text = pytesseract.image_to_string(rgb)
+            # Tesseract works on grayscale anyway: let the JPEG decoder emit luma directly
+            # (and scale down only very large images), then skip the 3-channel buffer
+            im.draft("L", (1600, 1600))
+            gray = ImageOps.autocontrast(im.convert("L"))
+            text = pytesseract.image_to_string(gray, config=TESSERACT_CONFIG, timeout=TESSERACT_TIMEOUT)
             text = (text or "").strip()
             if not text:
                 return None
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 PROMPT_VERSION = "v4"
 
 SYSTEM_PROMPT = (
@@ -115,3 +117,15 @@ Additional OpenAI-specific instructions:
 - If confidence_radius_km > 150, also set latitude and longitude to null.
 - Do not invent non-existent road numbers or place names.
 """
+
+
+@lru_cache(maxsize=32)
+def _user_template(provider: str, top_k: int) -> str:
+    # The top_k substitution only depends on (provider, top_k); render it once per pair
+    base = USER_PROMPT_TEMPLATE_OPENAI if provider == "openai" else USER_PROMPT_TEMPLATE
+    return base.replace("<<TOP_K_MINUS_1>>", str(max(1, top_k - 1)))
+
+
+def render_user_prompt(provider: str, top_k: int, ocr_text: str) -> str:
+    """User prompt for a provider/top_k with the OCR text filled in."""
+    return _user_template(provider, top_k).replace("<<OCR_TEXT>>", ocr_text or "(none)")
@@ -4,6 +4,7 @@ import base64
 import hashlib
 import io
 import os
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 
@@ -15,34 +16,105 @@ ALLOWED_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
 
 def ensure_image_path(path: str | os.PathLike[str]) -> Path:
     p = Path(path)
-    if not p.exists():
-        raise FileNotFoundError(f"Image not found: {p}")
-    if p.suffix.lower() not in ALLOWED_EXTS:
-        raise ValueError(f"Unsupported image type {p.suffix}. Supported: {sorted(ALLOWED_EXTS)}")
+    # One stat both proves the file exists and versions the memo below, so a file that was
+    # deleted or replaced is re-checked instead of served from a stale entry
+    try:
+        st = os.stat(p)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Image not found: {p}") from None
+    _check_image_suffix(os.fspath(path), st.st_mtime_ns)
     return p
 
 
-def load_image_bytes(path: str | os.PathLike[str]) -> bytes:
-    p = ensure_image_path(path)
-    with Image.open(p) as im:
-        # Convert to RGB to avoid weird formats, strip EXIF
+@lru_cache(maxsize=1024)
+def _check_image_suffix(path: str, mtime_ns: int) -> None:
+    # Failed checks raise, and lru_cache never stores those
+    suffix = os.path.splitext(path)[1]
+    if suffix.lower() not in ALLOWED_EXTS:
+        raise ValueError(f"Unsupported image type {suffix}. Supported: {sorted(ALLOWED_EXTS)}")
+
+
+def load_image_bytes(
+    source: str | os.PathLike[str] | bytes,
+    max_side: Optional[int] = None,
+    quality: int = 85,
+    strip_exif: bool = True,
+) -> bytes:
+    """Return image bytes for upload; `source` is a path or the file's raw bytes (see read_and_hash).
+
+    A plain RGB/grayscale JPEG or WebP that already fits within max_side is passed through
+    untouched, provided it carries no EXIF/XMP metadata (photo GPS tags would give the answer
+    away and leak the user's location) unless strip_exif is False; anything else is converted,
+    downscaled to max_side on the long edge if given, and re-encoded as JPEG without metadata.
+    Use sniff_mime() to label the result.
+    """
+    src = io.BytesIO(source) if isinstance(source, bytes) else ensure_image_path(source)
+    with Image.open(src) as im:
+        # Image.open only parsed the header so far; decide before decoding any pixels
+        if (
+            not (strip_exif and ("exif" in im.info or "xmp" in im.info))
+            and im.format in ("JPEG", "WEBP")
+            and im.mode in ("RGB", "L")
+            and (not max_side or max(im.size) <= max_side)
+        ):
+            return source if isinstance(source, bytes) else src.read_bytes()
+        if max_side:
+            # JPEG sources are subsampled by the decoder itself (no-op for other formats)
+            im.draft("RGB", (max_side, max_side))
+        # Convert to RGB to avoid weird formats; the re-encode drops EXIF/XMP
         rgb = im.convert("RGB")
+        if max_side:
+            # Bilinear is plenty for a model input and much cheaper than LANCZOS
+            rgb.thumbnail((max_side, max_side), Image.Resampling.BILINEAR)
         buf = io.BytesIO()
-        rgb.save(buf, format="JPEG", quality=92)
+        rgb.save(buf, format="JPEG", quality=quality, optimize=False, progressive=False)
         return buf.getvalue()
 
 
 def sha256_file(path: str | os.PathLike[str]) -> str:
-    h = hashlib.sha256()
-    with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
-            h.update(chunk)
-    return h.hexdigest()
+    # file_digest runs the read/update loop in C with its own buffer
+    with open(path, "rb", buffering=0) as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def cache_key_hash(data: bytes) -> str:
+    """Short content hash of image bytes for use in cache keys (not for security).
+
+    BLAKE2b is faster than SHA-256 here, and an 8-byte digest gives the 16 hex chars the keys
+    always used.
+    """
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+def read_and_hash(path: str | os.PathLike[str]) -> tuple[str, bytes]:
+    """Read an image file once, returning (cache_key_hash of its contents, raw bytes).
+
+    Lets callers hash and decode the same buffer instead of reading the file twice.
+    """
+    p = ensure_image_path(path)
+    with open(p, "rb") as f:
+        data = f.read()
+    return cache_key_hash(data), data
+
+
+def sniff_mime(buf: bytes) -> str:
+    """MIME type of an encoded image from its magic bytes; defaults to JPEG."""
+    if buf[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if buf[:4] == b"RIFF" and buf[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+
+def b64_data_url(image_bytes: bytes) -> str:
+    # Build the URL as bytes and decode once, rather than decoding then formatting a copy
+    head = b"data:" + sniff_mime(image_bytes).encode("ascii") + b";base64,"
+    return (head + base64.b64encode(image_bytes)).decode("ascii")
 
 
 def b64_data_url_jpeg(image_bytes: bytes) -> str:
-    b64 = base64.b64encode(image_bytes).decode("ascii")
-    return f"data:image/jpeg;base64,{b64}"
+    # Baseline public helper; always labels the data as JPEG (see b64_data_url)
+    return (b"data:image/jpeg;base64," + base64.b64encode(image_bytes)).decode("ascii")
 
 
 def get_cache_dir() -> Path:
@@ -0,0 +1,27 @@
+import orjson
+
+from geoguessr_locate.cache import Cache
+
+
+def test_entries_are_sharded(tmp_path):
+    cache = Cache(tmp_path)
+    cache.set("k", {"v": 1})
+    stored = cache._path("k")
+    assert stored.parent.parent == tmp_path and stored.is_file()
+    assert Cache(tmp_path).get("k") == {"v": 1}
+
+
+def test_legacy_flat_entries_are_read(tmp_path):
+    (tmp_path / "old.json").write_bytes(orjson.dumps([1, 2]))
+    assert Cache(tmp_path).get("old") == [1, 2]
+
+
+def test_memory_layer_is_bounded_lru(tmp_path):
+    cache = Cache(tmp_path)
+    cache._mem_cap = 2
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert list(cache._mem) == ["a", "c"]
+    assert cache.get("b") == 2  # evicted from memory, still on disk
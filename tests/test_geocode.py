@@ -0,0 +1,71 @@
+import time
+
+import orjson
+
+from geoguessr_locate import geocode
+from geoguessr_locate.cache import Cache
+
+PLACE = {"country": "France", "state": None, "county": None, "city": "Paris", "display_name": "Paris"}
+
+
+def test_token_bucket_spaces_requests():
+    bucket = geocode._TokenBucket(rate=50.0)
+    start = time.monotonic()
+    bucket.acquire()
+    bucket.acquire()
+    assert time.monotonic() - start >= 0.015
+    bucket.seed(time.time())
+    assert bucket.tokens < 0.1
+
+
+def test_reverse_reuses_nearby_cell(tmp_path):
+    cache = Cache(tmp_path)
+    cy, cx = geocode._cell(48.1001, 2.35)
+    cache.set(geocode._reverse_key(cy, cx), {"lat": 48.1001, "lon": 2.35, "place": PLACE})
+    key, _, place = geocode._reverse_cached(48.0999, 2.35, cache)  # one cell further south
+    assert key == geocode._reverse_key(cy, cx) and place.city == "Paris"
+    assert geocode._reverse_cached(48.02, 2.35, cache) is None  # ~9 km away
+
+
+class _Resp:
+    def __init__(self, status, body=None, headers=None):
+        self.status_code = status
+        self.content = orjson.dumps(body or {})
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        pass
+
+
+def _stale_entry(tmp_path, monkeypatch, resp):
+    cache = Cache(tmp_path)
+    key = geocode._reverse_key(*geocode._cell(48.85, 2.35))
+    cache.set(key, {"lat": 48.85, "lon": 2.35, "place": PLACE, "etag": '"v1"', "fetched": 0.0})
+    sent = {}
+
+    def fake_request(lat, lon, headers=None):
+        sent.update(headers or {})
+        return resp
+
+    monkeypatch.setattr(geocode, "_rate_limit_gate", lambda cache: None)
+    monkeypatch.setattr(geocode, "_request_reverse", fake_request)
+    place = geocode.reverse_geocode(48.85, 2.35, cache)
+    return place, cache.get(key), sent
+
+
+def test_revalidation_not_modified_keeps_entry(tmp_path, monkeypatch):
+    place, entry, sent = _stale_entry(tmp_path, monkeypatch, _Resp(304))
+    assert sent == {"If-None-Match": '"v1"'}
+    assert place.city == "Paris" and entry["etag"] == '"v1"' and entry["fetched"] > 0
+
+
+def test_revalidation_replaces_changed_entry(tmp_path, monkeypatch):
+    body = {"address": {"country": "France", "city": "Paris 1er"}, "display_name": "Paris 1er"}
+    place, entry, _ = _stale_entry(tmp_path, monkeypatch, _Resp(200, body, {"ETag": '"v2"'}))
+    assert place.city == "Paris 1er" and entry["etag"] == '"v2"'
+
+
+def test_non_finite_coordinates_are_not_looked_up(tmp_path):
+    cache = Cache(tmp_path)
+    assert geocode.reverse_geocode(float("nan"), 2.35, cache) is None
+    assert geocode.reverse_geocode(48.85, float("inf"), cache) is None
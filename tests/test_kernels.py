@@ -0,0 +1,15 @@
+import random
+
+from geoguessr_locate._kernels import neighbor_counts
+from geoguessr_locate._scoring import haversine_distance
+
+
+def test_neighbor_counts_matches_brute_force():
+    rng = random.Random(7)
+    pts = [(rng.uniform(-60, 60), rng.uniform(-180, 180)) for _ in range(60)]
+    pts += [(48.85 + rng.uniform(-0.5, 0.5), 2.35 + rng.uniform(-0.5, 0.5)) for _ in range(20)]
+    expected = [
+        sum(1 for j, q in enumerate(pts) if j != i and haversine_distance(*p, *q) <= 300.0)
+        for i, p in enumerate(pts)
+    ]
+    assert neighbor_counts([p[0] for p in pts], [p[1] for p in pts], 300.0) == expected
@@ -0,0 +1,70 @@
+import asyncio
+import threading
+import time
+
+from geoguessr_locate import model_client
+from geoguessr_locate.cache import Cache
+from geoguessr_locate.types import Candidate, Cues, ModelOutput
+
+
+def _output():
+    primary = Candidate(rank=1, confidence=0.6, country_code="NZ", latitude=-43.5, longitude=172.6,
+                        confidence_radius_km=40.0, cues=Cues(driving_side="left"))
+    alt = Candidate(rank=2, confidence=0.2, country_code="AU")
+    return ModelOutput(primary_guess=primary, alternatives=[alt])
+
+
+def _cache_hit(tmp_path, monkeypatch, stored):
+    cache = Cache(tmp_path)
+    monkeypatch.setattr(model_client, "_image_hash", lambda path, cache: ("abc123", None))
+    key = (f"gemini_m_{model_client.PROMPT_VERSION}_3_"
+           f"{model_client.UPLOAD_MAX_SIDE}q{model_client.UPLOAD_QUALITY}_abc123")
+    cache.set(key, stored)
+    return model_client.analyze_image("x.jpg", top_k=3, model_name="m", cache=cache, provider="gemini")
+
+
+def test_cache_hit_round_trip(tmp_path, monkeypatch):
+    out = _output()
+    got = _cache_hit(tmp_path, monkeypatch, out.model_dump_json())
+    assert got == out
+    assert isinstance(got.primary_guess.cues, Cues)
+
+
+def test_cache_hit_old_schema_is_validated(tmp_path, monkeypatch):
+    out = _output()
+    d = out.model_dump(mode="json")
+    d["primary_guess"]["retired_field"] = 1
+    del d["alternatives"][0]["cues"]
+    got = _cache_hit(tmp_path, monkeypatch, d)
+    assert got == out
+
+
+
+def test_first_json_object():
+    text = 'Sure: {"a": "}{", "b": {"c": "\\"}"}} trailing }'
+    assert model_client._first_json_object(text) == '{"a": "}{", "b": {"c": "\\"}"}}'
+    assert model_client._first_json_object('{"a": 1') is None
+    assert model_client._parse_model_json('```json\n{"a": 1}\n```') == {"a": 1}
+
+
+def test_batch_keeps_order_bounds_concurrency_and_isolates_failures(tmp_path, monkeypatch):
+    lock = threading.Lock()
+    state = {"in_flight": 0, "peak": 0}
+
+    def fake_analyze(path, **kwargs):
+        with lock:
+            state["in_flight"] += 1
+            state["peak"] = max(state["peak"], state["in_flight"])
+        time.sleep(0.02)
+        with lock:
+            state["in_flight"] -= 1
+        if path == "bad.jpg":
+            raise RuntimeError("boom")
+        return path
+
+    monkeypatch.setattr(model_client, "analyze_image", fake_analyze)
+    paths = [f"{i}.jpg" for i in range(6)] + ["bad.jpg", "7.jpg"]
+    results = asyncio.run(model_client.analyze_images_batch(paths, concurrency=2, cache=Cache(tmp_path)))
+    assert results[:6] == paths[:6] and results[7] == "7.jpg"
+    assert isinstance(results[6], RuntimeError)
+    assert state["peak"] <= 2
@@ -0,0 +1,37 @@
+import itertools
+
+import pytest
+
+from geoguessr_locate._scoring import calculate_cue_score, refine_confidence
+from geoguessr_locate.types import Candidate, Cues
+
+
+def _reference_cue_score(cues):
+    # The original branch-by-branch scoring the lookup tables replaced
+    score = total = 0.0
+    if cues.languages_seen:
+        score += len(cues.languages_seen) * 0.15
+        total += 0.45
+    for value, w in ((cues.driving_side, 0.1), (cues.road_markings, 0.15),
+                     (cues.signage_features, 0.15), (cues.vegetation_climate, 0.1),
+                     (cues.electrical_infrastructure, 0.1), (cues.other_cues, 0.05)):
+        if value:
+            score += w
+            total += w
+    return score / total if total > 0 else 0.0
+
+
+def test_cue_table_matches_reference():
+    for langs, *flags in itertools.product((None, ["en"], ["en", "fr", "de"]), *[(None, "x")] * 6):
+        cues = Cues(languages_seen=langs, driving_side=flags[0], road_markings=flags[1],
+                    signage_features=flags[2], vegetation_climate=flags[3],
+                    electrical_infrastructure=flags[4], other_cues=flags[5])
+        assert calculate_cue_score(cues) == pytest.approx(_reference_cue_score(cues))
+
+
+def test_location_table_matches_reference():
+    for fields in itertools.product((None, "x"), repeat=4):
+        c = Candidate(rank=1, confidence=0.5, country_code=fields[0], admin1=fields[1],
+                      admin2=fields[2], nearest_city=fields[3])
+        location = 1.0 if any(fields) else 0.0
+        assert refine_confidence(c) == pytest.approx(0.5 * 0.4 + location * 0.3)
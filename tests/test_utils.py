@@ -0,0 +1,33 @@
+import io
+
+from PIL import Image
+
+from geoguessr_locate.utils import load_image_bytes, sniff_mime
+
+
+def _encode(fmt, mode="RGB", size=(64, 48), **kw):
+    buf = io.BytesIO()
+    Image.new(mode, size).save(buf, format=fmt, **kw)
+    return buf.getvalue()
+
+
+def test_sniff_mime():
+    assert sniff_mime(_encode("JPEG")) == "image/jpeg"
+    assert sniff_mime(_encode("PNG")) == "image/png"
+    assert sniff_mime(_encode("WEBP")) == "image/webp"
+
+
+def test_small_plain_jpeg_and_webp_pass_through():
+    for fmt in ("JPEG", "WEBP"):
+        data = _encode(fmt)
+        assert load_image_bytes(data, max_side=1536) is data
+
+
+def test_reencodes_png_oversized_and_exif():
+    exif = Image.Exif()
+    exif[0x010F] = "camera"
+    for data in (_encode("PNG"), _encode("JPEG", size=(2000, 100)), _encode("JPEG", exif=exif)):
+        out = load_image_bytes(data, max_side=1536)
+        assert out is not data and sniff_mime(out) == "image/jpeg"
+        with Image.open(io.BytesIO(out)) as im:
+            assert max(im.size) <= 1536 and "exif" not in im.info